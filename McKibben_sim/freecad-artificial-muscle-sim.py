@@ -19,74 +19,113 @@ if os.path.exists(FREECAD_PATH):
     os.add_dll_directory(FREECAD_PATH)
     sys.path.append(FREECAD_PATH)
 
+# 形状計算は FreeCAD に依存しない muscle_kinematics.py にある
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import numpy as np
+import muscle_kinematics
+import muscle_physics
+from muscle_kinematics import ArtificialMuscle
+
 try:
     import FreeCAD
     import FreeCADGui
     #import Part
+    import Mesh
+    from pivy import coin
     from PySide import QtCore, QtGui
     has_gui = FreeCAD.GuiUp # GUIが起動しているかどうかを確認
 except ImportError as e:
     print(f"エラー: FreeCADのインポートに失敗しました")
     print(f"FreeCADがインストールされているか確認してください")
+    print(f"（GUIなしで形状だけ計算する場合は muscle_kinematics.py を使ってください）")
     print(f"詳細: {e}")
     sys.exit(1)
 
 
-class ArtificialMuscle:
+# 描画方式
+# "cylinders": セグメントごとに Part::Cylinder を作る（毎フレーム doc.recompute() する）
+# "mesh": 筋肉1本を1つの Coin3D のメッシュにして頂点だけ書き換える（recompute は「形状を確定」の時だけ）
+RENDER_MODE = "cylinders"
+
+# メッシュ表示の細かさ（1セグメントあたりの点の数と、断面の分割数）
+MESH_POINTS_PER_SEGMENT = 4
+MESH_SIDES = 16
+
+# 空気圧モデルで駆動する時の1フレームの長さと、その中の時間刻み（秒）
+PHYSICS_FRAME = 0.05
+PHYSICS_DT = 1e-3
+
+
+def _to_array(v):
+    return (v.x, v.y, v.z)
+
+
+class AnchorCache:
     """
-    ファイバー型人工筋肉のモデル
+    アンカーオブジェクトの重心 (Shape.CenterOfMass) のキャッシュ
+
+    CenterOfMass は呼ぶたびに質量特性を計算し直すので、アンカーが動いた時だけ計算します。
+    - Placement は毎回読んで、前回と違えば計算し直す（Placement の読み出しは軽い）
+    - ドキュメントオブザーバーとして登録すると、Shape が変わった時（半径の変更など）も捨てる
     """
-    def __init__(self, name, length, diameter, segments, start_obj_name, end_obj_name):
-        self.name = name
-        self.original_length = length
-        self.current_length = length
-        self.diameter = diameter
-        self.segments = segments
-        self.contraction_ratio = 0.0  # 0.0 (完全伸長) ~ 1.0 (最大収縮)
-        self.initial_volume = math.pi * (diameter**2) * length
-        
-        # アンカーとなるオブジェクト名
-        self.start_object_name = start_obj_name
-        self.end_object_name = end_obj_name
+    def __init__(self):
+        self._entries = {}  # (ドキュメント名, オブジェクト名) -> (Placement のキー, 重心)
+        self.hits = 0
+        self.misses = 0
 
-        # 収縮パラメータ
-        self.max_contraction = 0.5  # 最大50%収縮
-        self.radial_expansion = 1.3  # 収縮時の半径膨張率
-        
-    def set_contraction(self, ratio):
-        """
-        収縮率を設定 (0.0 ~ 1.0)
+    def get(self, doc, name):
         """
-        self.contraction_ratio = max(0.0, min(1.0, ratio))
-        self.current_length = self.original_length * (1 - self.contraction_ratio * self.max_contraction)
-    
-    def get_segment_params(self, segment_index, current_total_length):
+        オブジェクトの重心を返す（オブジェクトが無ければ None）
         """
-        各セグメントのパラメータを計算（軸方向の位置と半径）
-        """
-        # 実際の距離に基づいて計算
-        segment_length = current_total_length / self.segments
-        z_position = segment_length * segment_index
-        
-        # 収縮に応じて半径が変化（体積保存則: V = pi * r^2 * L -> r = sqrt(V / (pi * L))）
-        current_radius = math.sqrt(self.initial_volume / (math.pi * current_total_length))
-        
-        return z_position, current_radius, segment_length
+        obj = doc.getObject(name)
+        if not obj:
+            return None
+        placement = obj.Placement
+        key = (_to_array(placement.Base), tuple(placement.Rotation.Q))
+        entry = self._entries.get((doc.Name, name))
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = (key, obj.Shape.CenterOfMass)
+            self._entries[(doc.Name, name)] = entry
+        # 呼び出し側が書き換えてもキャッシュが壊れないようにコピーを返す
+        return FreeCAD.Vector(entry[1])
+
+    def invalidate(self, obj):
+        self._entries.pop((obj.Document.Name, obj.Name), None)
+
+    # ドキュメントオブザーバー（FreeCAD.addDocumentObserver で登録する）
+    def slotChangedObject(self, obj, prop):
+        if prop in ("Placement", "Shape"):
+            self.invalidate(obj)
+
+    def slotDeletedObject(self, obj):
+        self.invalidate(obj)
+
+
+anchor_cache = AnchorCache()
+
 
 class MusclePart:
     """
     FreeCADでの人工筋肉パーツ管理
     """
+    # 形状を書き換えた後に doc.recompute() が必要か
+    needs_recompute = True
+
     def __init__(self, doc, muscle):
         self.doc = doc
         self.muscle = muscle
         self.cylinders = []
+        self._last_state = None  # 最後に書き込んだ (収縮率, 始点, 終点)
         self.create_muscle()
     
     def create_muscle(self):
         """
         人工筋肉の初期形状を作成
         """
+        self._last_state = None
         # 生成する前に、既存のセグメントをすべて削除する
         # (他と被らないようにPrefixにIDを含める)
         prefix = f"{self.muscle.name}_Seg_"
@@ -102,7 +141,8 @@ class MusclePart:
         # 初期配置の計算
         diff = p2.sub(p1)
         current_length = diff.Length
-        direction = diff.normalize()
+        # FreeCAD.Vector の normalize / multiply は自分自身を書き換えるのでコピーしてから使う
+        direction = FreeCAD.Vector(diff).normalize()
         rot = FreeCAD.Rotation(FreeCAD.Vector(0, 0, 1), direction)
 
         for i in range(self.muscle.segments):
@@ -115,7 +155,7 @@ class MusclePart:
             cylinder.Height = seg_len
             
             # 配置
-            offset = direction.multiply(z_pos)
+            offset = FreeCAD.Vector(direction).multiply(z_pos)
             pos = p1.add(offset)
             cylinder.Placement = FreeCAD.Placement(pos, rot)
             
@@ -129,163 +169,90 @@ class MusclePart:
     
     def _get_anchor_positions(self):
         """
-        アンカーオブジェクトから現在の座標を取得
+        アンカーオブジェクトから現在の座標を取得（アンカーが動いていなければキャッシュから）
         """
-        obj_start = self.doc.getObject(self.muscle.start_object_name)
-        obj_end = self.doc.getObject(self.muscle.end_object_name)
+        p1 = anchor_cache.get(self.doc, self.muscle.start_object_name)
+        p2 = anchor_cache.get(self.doc, self.muscle.end_object_name)
         
-        if not obj_start or not obj_end:
+        if p1 is None or p2 is None:
             print(f"Warning: Anchors for {self.muscle.name} not found.")
             return None, None
             
-        return obj_start.Shape.CenterOfMass, obj_end.Shape.CenterOfMass
+        return p1, p2
 
     def get_arc_points(self, p1, p2, num_points):
         """
         p1からp2へ向かう円弧上の点を計算してリストで返す
         num_points: 点の数（始点・終点含む）
         """
-        points = []
-        vec = p2.sub(p1)
-        dist = vec.Length
-        
-        # 収縮率に応じたアーチの高さ (Sagitta)
-        # 収縮率 0.0 (伸長) -> 高さ最大 (R小) -> よく曲がる
-        # 収縮率 1.0 (収縮) -> 高さ 0 (R大/無限) -> 直線
-        # ※ユーザー要望: "収縮に伴ってRが大きくなる" = "カーブが緩やかになる"
-        
-        # 最大高さ (任意: アンカー間距離の20%程度とする)
-        max_h = dist * 0.2
-        current_h = max_h * (1.0 - self.muscle.contraction_ratio)
-        
-        # 直線の場合
-        if current_h < 0.1:
-            for i in range(num_points):
-                t = i / (num_points - 1)
-                pt = p1.add(vec.multiply(t))
-                points.append(pt)
-            return points
-            
-        # 円弧の場合
-        # 弦の中点
-        mid = p1.add(p2).multiply(0.5)
-        
-        # アーチの方向 (上方向)
-        # Z軸方向を優先、もしZ軸並行ならX軸
-        direction = vec.normalize()
-        if abs(direction.z) < 0.9:
-            up = FreeCAD.Vector(0, 0, 1)
-        else:
-            up = FreeCAD.Vector(1, 0, 0)
-            
-        normal = direction.cross(up).normalize()
-        arch_dir = normal.cross(direction).normalize()
-        
-        # 円弧の計算
-        # 弦長 L = dist, 高さ h = current_h
-        # R = ( (L/2)^2 + h^2 ) / (2h)
-        L = dist
-        h = current_h
-        R = ((L/2)**2 + h**2) / (2*h)
-        
-        # 中心から弦までの距離 d = R - h
-        d_center = R - h
-        
-        # 円の中心
-        center = mid.sub(arch_dir.multiply(d_center))
-        
-        # 角度計算
-        # 始点ベクトル (center -> p1)
-        v_start = p1.sub(center)
-        # 終点ベクトル (center -> p2)
-        v_end = p2.sub(center)
-        
-        # 2ベクトル間の角度 (0 ~ pi)
-        total_angle = v_start.getAngle(v_end)
-        
-        # 回転軸
-        rot_axis = v_start.cross(v_end).normalize() # normalと同じはず
-        
-        for i in range(num_points):
-            t = i / (num_points - 1)
-            # 現在の角度
-            angle = total_angle * t
-            
-            # v_start を angle だけ回転
-            rot = FreeCAD.Rotation(rot_axis, math.degrees(angle))
-            v_current = rot.multVec(v_start)
-            
-            pt = center.add(v_current)
-            points.append(pt)
-            
-        return points
+        points = muscle_kinematics.arc_points(
+            _to_array(p1), _to_array(p2), self.muscle.contraction_ratio, num_points
+        )
+        return [FreeCAD.Vector(*pt) for pt in points]
+
+    def _state_changed(self, p1, p2):
+        """
+        収縮率とアンカー位置が前回書き込んだ時から変わっていれば True（覚え直す）
+        """
+        state = (self.muscle.contraction_ratio, _to_array(p1), _to_array(p2))
+        if state == self._last_state:
+            return False
+        self._last_state = state
+        return True
 
     def update_muscle(self):
         """
         筋肉の形状と色を更新
         """
+        if self.apply_geometry() and self.needs_recompute:
+            self.doc.recompute()
+
+    def apply_geometry(self):
+        """
+        形状と色のプロパティを書き換える（doc.recompute() はしない）
+
+        Returns:
+            bool: 書き換えたら True（収縮率もアンカーも変わっていなければ何もしない）
+        """
         doc = self.doc
         if not doc:
-            return
+            return False
 
         p1, p2 = self._get_anchor_positions()
-        if p1 is None:
-            return
+        if p1 is None or not self._state_changed(p1, p2):
+            return False
 
-        # アンカー間の距離
-        anchor_dist = p1.sub(p2).Length
-        
-        # 筋肉の太さ (体積一定)
-        # 長さは円弧長になるが、簡易的にアンカー間距離ベースで計算
-        # あるいは正確に円弧長を出すことも可能だが、見た目重視ならこれで十分
-        # 収縮すると太くなる
-        # current_len ~ anchor_dist (or arc length)
-        # 半径 R_muscle(太さ) は収縮率で決める方が安定する
-        # R_muscle = R0 * (1 + 0.3 * ratio) ?
-        # 元の計算: V = pi * r^2 * L.
-        # ここでは L を anchor_dist * (1 + something) とみなすか?
-        # 簡易的に: 収縮率に応じて太くする
-        base_radius = self.muscle.diameter / 2.0
-        # 膨張率
-        expansion = 1.0 + self.muscle.contraction_ratio * 0.5 # 最大1.5倍
-        current_radius = base_radius * expansion
-        
         ratio = self.muscle.contraction_ratio
         current_color = (0.5 + 0.5 * ratio, 0.1, 1.0 - ratio)
 
-        # セグメントの配置計算
-        # N個のセグメント -> N+1個の点が必要
-        num_segments = self.muscle.segments
-        points = self.get_arc_points(p1, p2, num_segments + 1)
-        
-        for i in range(num_segments):
+        # セグメントの配置計算（N個のセグメント -> N+1個の点）
+        # 太さは収縮率に応じて太くする（最大 radial_expansion 倍）
+        geometry = muscle_kinematics.evaluate(
+            _to_array(p1), _to_array(p2), ratio, self.muscle.diameter, self.muscle.segments,
+            self.muscle.radial_expansion - 1.0
+        )
+        current_radius = float(geometry.radii)
+
+        for i in range(self.muscle.segments):
             obj_name = f"{self.muscle.name}_Seg_{i}"
             cylinder = doc.getObject(obj_name)
-            
+
             if cylinder:
-                pt_start = points[i]
-                pt_end = points[i+1]
-                
-                # ベクトル
-                vec_seg = pt_end.sub(pt_start)
-                length_seg = vec_seg.Length
-                
                 # 形状更新
                 cylinder.Radius = current_radius
-                cylinder.Height = length_seg
-                
+                cylinder.Height = float(geometry.lengths[i])
+
                 # 回転と配置
-                # Cylinderはデフォルトで(0,0,1)方向を向いている
-                # これを vec_seg方向に回転させる
-                rot = FreeCAD.Rotation(FreeCAD.Vector(0,0,1), vec_seg.normalize())
-                
+                # Cylinderはデフォルトで(0,0,1)方向を向いているので、セグメントの方向に回転させる
+                rot = FreeCAD.Rotation(*geometry.quaternions[i])
+
                 # 位置は始点
-                cylinder.Placement = FreeCAD.Placement(pt_start, rot)
+                cylinder.Placement = FreeCAD.Placement(FreeCAD.Vector(*geometry.starts[i]), rot)
 
                 if hasattr(cylinder, "ViewObject"):
                     cylinder.ViewObject.ShapeColor = current_color
-        
-        doc.recompute()
+
+        return True
 
     def remove(self):
         """
@@ -303,6 +270,170 @@ class MusclePart:
         self.create_muscle()
 
 
+class MuscleMeshPart(MusclePart):
+    """
+    人工筋肉を1本につき1つの Coin3D メッシュとして表示する
+
+    毎フレーム頂点バッファ（SoCoordinate3）を書き換えるだけなので、ドキュメントの再計算は起きません。
+    commit() を呼んだ時だけ、今の形状を Mesh::Feature としてドキュメントに書き込みます。
+    """
+    needs_recompute = False
+
+    def __init__(self, doc, muscle):
+        self.node = None
+        self.mesh_object = None
+        super().__init__(doc, muscle)
+
+    def _num_points(self):
+        return self.muscle.segments * MESH_POINTS_PER_SEGMENT + 1
+
+    def create_muscle(self):
+        """
+        シーングラフにメッシュのノードを追加して初期形状を作成
+        """
+        self._last_state = None
+        view = FreeCADGui.ActiveDocument.ActiveView if FreeCADGui.ActiveDocument else None
+        if view is None:
+            print(f"Warning: No 3D view for {self.muscle.name}.")
+            return
+
+        # SoSwitch の下に 材質 -> 頂点 -> 四角形メッシュ を並べる
+        self.node = coin.SoSwitch()
+        self.node.whichChild = coin.SO_SWITCH_ALL
+        self.material = coin.SoMaterial()
+        self.coords = coin.SoCoordinate3()
+        self.quads = coin.SoQuadMesh()
+        self.quads.verticesPerRow = MESH_SIDES + 1
+        self.quads.verticesPerColumn = self._num_points()
+        for child in (self.material, self.coords, self.quads):
+            self.node.addChild(child)
+        view.getSceneGraph().addChild(self.node)
+        self.update_muscle()
+
+    def _compute_vertices(self, p1, p2):
+        ratio = self.muscle.contraction_ratio
+        points = muscle_kinematics.arc_points(_to_array(p1), _to_array(p2), ratio, self._num_points())
+        radius = muscle_kinematics.muscle_radius(self.muscle.diameter, ratio, self.muscle.radial_expansion - 1.0)
+        return muscle_kinematics.tube_vertices(points, radius, MESH_SIDES)
+
+    def apply_geometry(self):
+        """
+        メッシュの頂点と色を書き換える（doc.recompute() は要らない）
+        """
+        if self.node is None:
+            return False
+        p1, p2 = self._get_anchor_positions()
+        if p1 is None or not self._state_changed(p1, p2):
+            return False
+        vertices = self._compute_vertices(p1, p2)
+
+        ratio = self.muscle.contraction_ratio
+        self.material.diffuseColor.setValue(0.5 + 0.5 * ratio, 0.1, 1.0 - ratio)
+        flat = vertices.reshape(-1, 3)
+        self.coords.point.setValues(0, len(flat), flat.tolist())
+
+        # 確定済みのメッシュは古くなったので隠して、動いている方を見せる
+        self.node.whichChild = coin.SO_SWITCH_ALL
+        if self.mesh_object is not None and hasattr(self.mesh_object, "ViewObject"):
+            self.mesh_object.ViewObject.Visibility = False
+        return True
+
+    def commit(self, recompute=True):
+        """
+        今の形状を Mesh::Feature としてドキュメントに書き込む（保存やエクスポート用）
+        """
+        p1, p2 = self._get_anchor_positions()
+        if p1 is None:
+            return
+        vertices = self._compute_vertices(p1, p2)
+        faces = muscle_kinematics.tube_faces(vertices.shape[0], MESH_SIDES)
+        triangles = vertices.reshape(-1, 3)[faces].reshape(-1, 3)
+
+        if self.mesh_object is None or self.doc.getObject(self.mesh_object.Name) is None:
+            self.mesh_object = self.doc.addObject("Mesh::Feature", f"{self.muscle.name}_Mesh")
+        self.mesh_object.Mesh = Mesh.Mesh(triangles.tolist())
+        if hasattr(self.mesh_object, "ViewObject"):
+            ratio = self.muscle.contraction_ratio
+            self.mesh_object.ViewObject.ShapeColor = (0.5 + 0.5 * ratio, 0.1, 1.0 - ratio)
+            self.mesh_object.ViewObject.Visibility = True
+        if self.node is not None:
+            self.node.whichChild = coin.SO_SWITCH_NONE
+        if recompute:
+            self.doc.recompute()
+
+    def remove(self):
+        """
+        人工筋肉を削除
+        """
+        if self.node is not None:
+            view = FreeCADGui.ActiveDocument.ActiveView if FreeCADGui.ActiveDocument else None
+            if view is not None:
+                view.getSceneGraph().removeChild(self.node)
+            self.node = None
+        if self.mesh_object is not None and self.doc.getObject(self.mesh_object.Name) is not None:
+            self.doc.removeObject(self.mesh_object.Name)
+        self.mesh_object = None
+
+
+class FrameScheduler:
+    """
+    筋肉の更新を1フレームにまとめる
+
+    スライダーやアニメーションからの更新要求は mark_dirty() で溜めておき、
+    イベントループに戻った時に1回だけ render_frame() で書き込みます。
+    プロパティの書き換えを全部終えてから、ドキュメントごとに doc.recompute() を1回だけ呼びます。
+    フレームを予約してから描くまでの間の要求は、その予約済みのフレームにまとめます（フレーム落ち）。
+    """
+    def __init__(self, on_frame=None):
+        """
+        Args:
+            on_frame: フレームを書き終えるたびに呼ぶ関数（フレーム時間の表示用）
+        """
+        self.on_frame = on_frame
+        self._dirty = []
+        self._pending = False
+        self.frames = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.last_frame_ms = 0.0
+
+    def mark_dirty(self, muscle_part):
+        if muscle_part not in self._dirty:
+            self._dirty.append(muscle_part)
+
+    def busy(self):
+        """
+        フレームを予約済みでまだ描いていなければ True
+        """
+        return self._pending
+
+    def request_frame(self):
+        if self.busy():
+            self.dropped += 1
+            return
+        self._pending = True
+        QtCore.QTimer.singleShot(0, self.render_frame)
+
+    def render_frame(self):
+        self._pending = False
+        start = time.perf_counter()
+        dirty, self._dirty = self._dirty, []
+        docs = []
+        for mp in dirty:
+            # 収縮率もアンカーも変わっていない筋肉は何も書き込まない
+            if not mp.apply_geometry():
+                self.skipped += 1
+                continue
+            if mp.needs_recompute and mp.doc not in docs:
+                docs.append(mp.doc)
+        for doc in docs:
+            doc.recompute()
+        self.frames += 1
+        self.last_frame_ms = (time.perf_counter() - start) * 1000
+        if self.on_frame:
+            self.on_frame(self)
+
+
 class MuscleControlPanel(QtGui.QWidget):
     """
     人工筋肉制御パネル
@@ -312,6 +443,8 @@ class MuscleControlPanel(QtGui.QWidget):
         self.muscle_parts = muscle_parts # List of MusclePart
         self.current_muscle_part = muscle_parts[0]
         self.animation_timer = None
+        self.physics_timer = None
+        self.scheduler = FrameScheduler(on_frame=self.on_frame)
         self.init_ui()
     
     def init_ui(self):
@@ -369,6 +502,10 @@ class MuscleControlPanel(QtGui.QWidget):
         self.slider.setValue(0)
         self.slider.valueChanged.connect(self.on_slider_change)
         layout.addWidget(self.slider)
+
+        # 1フレームの書き込みにかかった時間
+        self.frame_label = QtGui.QLabel("フレーム: -")
+        layout.addWidget(self.frame_label)
         
         # アニメーションボタン
         button_layout = QtGui.QHBoxLayout()
@@ -381,6 +518,18 @@ class MuscleControlPanel(QtGui.QWidget):
         button_layout.addWidget(stop_btn)
         
         layout.addLayout(button_layout)
+
+        # 空気圧モデルで駆動（スライダーが圧力指令になる）
+        self.physics_btn = QtGui.QPushButton("空気圧モデルで駆動")
+        self.physics_btn.setCheckable(True)
+        self.physics_btn.toggled.connect(self.toggle_physics)
+        layout.addWidget(self.physics_btn)
+
+        # メッシュ表示の時だけ、今の形状をドキュメントに書き込むボタンを出す
+        if any(hasattr(mp, "commit") for mp in self.muscle_parts):
+            commit_btn = QtGui.QPushButton("形状を確定")
+            commit_btn.clicked.connect(self.commit_geometry)
+            layout.addWidget(commit_btn)
         
         # 閉じるボタン
         close_btn = QtGui.QPushButton("閉じる")
@@ -438,20 +587,46 @@ class MuscleControlPanel(QtGui.QWidget):
 
     def on_slider_change(self, value):
         ratio = value / 100.0
-        self.slider_label.setText(f"収縮率: {value}%")
         
         targets = []
         if self.current_muscle_part:
             targets = [self.current_muscle_part]
         else:
             targets = self.muscle_parts
+
+        if self.physics_timer is not None:
+            # 空気圧モデルで駆動中は圧力指令を変えるだけ（形状はモデルが決める）
+            self.slider_label.setText(f"圧力指令: {value}%")
+            for mp in targets:
+                i = self.muscle_parts.index(mp)
+                self.pressure_command[i] = ratio * self.model.supply_pressure[i]
+            return
+
+        self.slider_label.setText(f"収縮率: {value}%")
             
+        # ここでは収縮率を変えるだけで、形状の書き込みと再計算は次のフレームでまとめてやる
         for mp in targets:
             mp.muscle.set_contraction(ratio)
-            mp.update_muscle()
+            self.scheduler.mark_dirty(mp)
+        self.scheduler.request_frame()
             
         # FreeCADGui.updateGui()
 
+    def on_frame(self, scheduler):
+        self.frame_label.setText(
+            f"フレーム: {scheduler.last_frame_ms:.1f} ms"
+            f"（変化なし {scheduler.skipped} / まとめた要求 {scheduler.dropped}）"
+        )
+
+    def commit_geometry(self):
+        """
+        メッシュ表示の筋肉の形状をドキュメントに書き込む（再計算は最後に1回だけ）
+        """
+        for mp in self.muscle_parts:
+            if hasattr(mp, "commit"):
+                mp.commit(recompute=False)
+        self.muscle_parts[0].doc.recompute()
+
     def start_animation(self):
         if self.animation_timer is not None:
             self.animation_timer.stop()
@@ -462,6 +637,11 @@ class MuscleControlPanel(QtGui.QWidget):
         self.animation_timer.start(50)
     
     def animate_step(self):
+        # 予約済みのフレームをまだ描いていなければ、このステップは飛ばす
+        if self.scheduler.busy():
+            self.scheduler.dropped += 1
+            return
+
         current_value = self.slider.value()
         new_value = current_value + self.animation_direction * 2
         
@@ -479,6 +659,62 @@ class MuscleControlPanel(QtGui.QWidget):
             self.animation_timer.stop()
             self.animation_timer = None
 
+    def toggle_physics(self, checked):
+        """
+        空気圧モデルでの駆動を開始・停止する
+        """
+        muscles = [mp.muscle for mp in self.muscle_parts]
+        if not checked:
+            if self.physics_timer is not None:
+                self.physics_timer.stop()
+                self.physics_timer = None
+                # drive() で書き換えた最大収縮率と太さを、スライダーで動かす時の値に戻す
+                for mp, (max_contraction, radial_expansion) in zip(self.muscle_parts, self.kinematic_limits):
+                    mp.muscle.max_contraction = max_contraction
+                    mp.muscle.radial_expansion = radial_expansion
+                    mp.muscle.set_contraction(mp.muscle.contraction_ratio)
+                    self.scheduler.mark_dirty(mp)
+                self.scheduler.request_frame()
+            self.slider_label.setText(f"収縮率: {self.slider.value()}%")
+            return
+
+        self.stop_animation()
+        self.kinematic_limits = [(m.max_contraction, m.radial_expansion) for m in muscles]
+        # 筋肉の寸法は mm なので m にしてモデルを作る
+        self.model = muscle_physics.McKibbenModel(
+            length=[m.original_length / 1000.0 for m in muscles],
+            diameter=[m.diameter / 1000.0 for m in muscles],
+        )
+        self.physics_state = self.model.initial_state()
+        self.pressure_command = np.zeros(self.model.shape)
+        self.slider.blockSignals(True)
+        self.slider.setValue(0)
+        self.slider.blockSignals(False)
+        self.slider_label.setText("圧力指令: 0%")
+
+        self.physics_timer = QtCore.QTimer(self)
+        self.physics_timer.timeout.connect(self.physics_step)
+        self.physics_timer.start(int(PHYSICS_FRAME * 1000))
+
+    def physics_step(self):
+        """
+        1フレーム分 (PHYSICS_FRAME 秒) モデルを進めて、形状に反映する
+        """
+        _, self.physics_state = self.model.simulate(
+            self.pressure_command, PHYSICS_FRAME, dt=PHYSICS_DT, state=self.physics_state,
+            record_every=int(round(PHYSICS_FRAME / PHYSICS_DT))
+        )
+        muscle_physics.drive([mp.muscle for mp in self.muscle_parts], self.model, self.physics_state)
+        for mp in self.muscle_parts:
+            self.scheduler.mark_dirty(mp)
+        self.scheduler.request_frame()
+
+    def closeEvent(self, event):
+        self.stop_animation()
+        self.physics_btn.setChecked(False)
+        FreeCAD.removeDocumentObserver(anchor_cache)
+        super().closeEvent(event)
+
 
 def setup_scene():
     """
@@ -525,6 +761,9 @@ def main():
     if FreeCAD.ActiveDocument:
         FreeCADGui.setActiveDocument(FreeCAD.ActiveDocument)
     
+    # アンカーが動いた時（Shape が変わった時）にキャッシュを捨てるようにする
+    FreeCAD.addDocumentObserver(anchor_cache)
+
     # シーンセットアップ
     print("シーンを構築中...")
     anchor_pairs = setup_scene()
@@ -534,8 +773,8 @@ def main():
     muscle_parts = []
     for i, (start_name, end_name) in enumerate(anchor_pairs):
         # 距離計算
-        p1 = doc.getObject(start_name).Shape.CenterOfMass
-        p2 = doc.getObject(end_name).Shape.CenterOfMass
+        p1 = anchor_cache.get(doc, start_name)
+        p2 = anchor_cache.get(doc, end_name)
         dist = p1.sub(p2).Length
         
         muscle = ArtificialMuscle(
@@ -546,7 +785,10 @@ def main():
             start_obj_name=start_name,
             end_obj_name=end_name
         )
-        mp = MusclePart(doc, muscle)
+        if RENDER_MODE == "mesh":
+            mp = MuscleMeshPart(doc, muscle)
+        else:
+            mp = MusclePart(doc, muscle)
         muscle_parts.append(mp)
     
     # ビュー調整
@@ -0,0 +1,274 @@
+"""
+人工筋肉の形状計算（FreeCAD なし、NumPy だけで動く）
+
+アンカー座標と収縮率の配列を渡すと、全ての筋肉・全てのセグメントの
+円弧上の点、セグメントの長さ、向き（クォータニオン）、半径をまとめて計算します。
+FreeCAD の GUI が無い Linux サーバーでも、大量の収縮率・アンカー配置を一度に評価できます。
+
+    python muscle_kinematics.py --configs 10000 --segments 20
+"""
+
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# 伸長時のアーチの高さ（アンカー間距離に対する割合）
+ARCH_RATIO = 0.2
+# アーチの高さがこれより小さい時は直線として扱う
+MIN_ARCH_HEIGHT = 0.1
+# 最大収縮時の半径の膨張率（1.0 + THICKENING 倍になる）
+THICKENING = 0.5
+
+MuscleGeometry = namedtuple("MuscleGeometry", ["points", "starts", "lengths", "quaternions", "radii"])
+
+
+class ArtificialMuscle:
+    """
+    ファイバー型人工筋肉のモデル
+    """
+    def __init__(self, name, length, diameter, segments, start_obj_name, end_obj_name):
+        self.name = name
+        self.original_length = length
+        self.current_length = length
+        self.diameter = diameter
+        self.segments = segments
+        self.contraction_ratio = 0.0  # 0.0 (完全伸長) ~ 1.0 (最大収縮)
+        self.initial_volume = math.pi * (diameter**2) * length
+
+        # アンカーとなるオブジェクト名
+        self.start_object_name = start_obj_name
+        self.end_object_name = end_obj_name
+
+        # 収縮パラメータ
+        self.max_contraction = 0.5  # 最大50%収縮
+        self.radial_expansion = 1.0 + THICKENING  # 最大収縮時の半径膨張率
+
+    def set_contraction(self, ratio):
+        """
+        収縮率を設定 (0.0 ~ 1.0)
+        """
+        self.contraction_ratio = max(0.0, min(1.0, ratio))
+        self.current_length = self.original_length * (1 - self.contraction_ratio * self.max_contraction)
+
+    def get_segment_params(self, segment_index, current_total_length):
+        """
+        各セグメントのパラメータを計算（軸方向の位置と半径）
+        """
+        # 実際の距離に基づいて計算
+        segment_length = current_total_length / self.segments
+        z_position = segment_length * segment_index
+
+        # 収縮に応じて半径が変化（体積保存則: V = pi * r^2 * L -> r = sqrt(V / (pi * L))）
+        current_radius = math.sqrt(self.initial_volume / (math.pi * current_total_length))
+
+        return z_position, current_radius, segment_length
+
+
+def _normalize(v):
+    norm = np.linalg.norm(v, axis=-1, keepdims=True)
+    return v / np.where(norm > 0, norm, 1.0)
+
+
+def arc_points(p1, p2, contraction, num_points, arch_ratio=ARCH_RATIO, min_height=MIN_ARCH_HEIGHT):
+    """
+    p1 から p2 へ向かう円弧上の点をまとめて計算する
+
+    収縮率 0.0 (伸長) でアーチが最も高く、1.0 (収縮) で直線になります。
+
+    Args:
+        p1, p2: 始点・終点の座標 (..., 3)
+        contraction: 収縮率 (...)
+        num_points (int): 1本あたりの点の数（始点・終点を含む）
+
+    Returns:
+        np.ndarray: 点の座標 (..., num_points, 3)
+    """
+    p1 = np.asarray(p1, dtype=float)
+    p2 = np.asarray(p2, dtype=float)
+    contraction = np.asarray(contraction, dtype=float)
+    p1, p2 = np.broadcast_arrays(p1, p2)
+    t = np.linspace(0.0, 1.0, num_points)
+
+    vec = p2 - p1
+    dist = np.linalg.norm(vec, axis=-1)
+    # 弦長 L = dist, 高さ h
+    h = dist * arch_ratio * (1.0 - contraction)
+    h, dist = np.broadcast_arrays(h, dist)
+    straight = h < min_height
+
+    # 直線の場合
+    line = p1[..., None, :] + vec[..., None, :] * t[:, None]
+
+    # アーチの方向 (上方向): Z軸方向を優先、もしZ軸並行ならX軸
+    direction = _normalize(vec)
+    up = np.where(np.abs(direction[..., 2:3]) < 0.9, [0.0, 0.0, 1.0], [1.0, 0.0, 0.0])
+    normal = _normalize(np.cross(direction, up))
+    arch_dir = _normalize(np.cross(normal, direction))
+
+    # R = ((L/2)^2 + h^2) / (2h)、円の中心は弦の中点から R - h だけ下
+    h_safe = np.where(straight, 1.0, h)
+    R = ((dist / 2) ** 2 + h_safe ** 2) / (2 * h_safe)
+    center = (p1 + p2) / 2 - arch_dir * (R - h_safe)[..., None]
+
+    v_start = p1 - center
+    v_end = p2 - center
+    cos_total = np.sum(v_start * v_end, axis=-1) / np.maximum(R * R, 1e-12)
+    total_angle = np.arccos(np.clip(cos_total, -1.0, 1.0))
+    axis = _normalize(np.cross(v_start, v_end))
+
+    # v_start を回転軸まわりに回す（v_start は回転軸と直交しているので Rodrigues の式の第3項は 0）
+    angle = total_angle[..., None] * t
+    cos, sin = np.cos(angle)[..., None], np.sin(angle)[..., None]
+    arc = center[..., None, :] + v_start[..., None, :] * cos + np.cross(axis, v_start)[..., None, :] * sin
+
+    return np.where(straight[..., None, None], line, arc)
+
+
+def quaternions_from_z(directions):
+    """
+    +Z 軸を directions の向きに回すクォータニオン (x, y, z, w) を計算する
+
+    FreeCAD.Rotation(x, y, z, w) にそのまま渡せます。
+    """
+    d = _normalize(np.asarray(directions, dtype=float))
+    # q = (Z × d, 1 + Z·d) を正規化（d が -Z の時は X 軸まわりに 180 度）
+    q = np.stack([-d[..., 1], d[..., 0], np.zeros(d.shape[:-1]), 1.0 + d[..., 2]], axis=-1)
+    opposite = q[..., 3] < 1e-9
+    q[opposite] = [1.0, 0.0, 0.0, 0.0]
+    return _normalize(q)
+
+
+def muscle_radius(diameter, contraction, thickening=THICKENING):
+    """
+    収縮率に応じた筋肉の太さ（収縮すると太くなる）
+    """
+    return np.asarray(diameter, dtype=float) / 2.0 * (1.0 + np.asarray(contraction, dtype=float) * thickening)
+
+
+def evaluate(p1, p2, contraction, diameter, segments, thickening=THICKENING):
+    """
+    全ての筋肉・全てのセグメントの形状を1回の呼び出しで計算する
+
+    Args:
+        p1, p2: 始点・終点の座標 (..., 3)
+        contraction: 収縮率 (...)
+        diameter: 筋肉の直径 (...)
+        segments (int): 1本あたりのセグメント数
+        thickening: 最大収縮時に半径が何割太くなるか (...)
+
+    Returns:
+        MuscleGeometry:
+            points (..., segments + 1, 3), starts (..., segments, 3),
+            lengths (..., segments), quaternions (..., segments, 4), radii (...)
+    """
+    points = arc_points(p1, p2, contraction, segments + 1)
+    starts = points[..., :-1, :]
+    vectors = points[..., 1:, :] - starts
+    return MuscleGeometry(
+        points=points,
+        starts=starts,
+        lengths=np.linalg.norm(vectors, axis=-1),
+        quaternions=quaternions_from_z(vectors),
+        radii=muscle_radius(diameter, contraction, thickening),
+    )
+
+
+def tube_vertices(points, radii, sides=12):
+    """
+    点列に沿った管（1本につき1つのメッシュ）の頂点をまとめて計算する
+
+    断面の向きは円弧の面の法線（筋肉1本で一定）から決めるので、弦がどの向きに傾いていても
+    隣り合う断面の間でねじれたり裏返ったりしません。直線の筋肉だけは弦と直交する適当な向きを使います。
+    継ぎ目を閉じるために各断面は sides + 1 個の頂点を持ちます（最初と最後が同じ位置）。
+
+    Args:
+        points: 中心線の点 (..., n, 3)
+        radii: 管の半径 (...)
+        sides (int): 断面の分割数
+
+    Returns:
+        np.ndarray: 頂点の座標 (..., n, sides + 1, 3)
+    """
+    points = np.asarray(points, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    tangent = _normalize(np.gradient(points, axis=-2))
+
+    # 円弧の面の法線 = 弦 × (始点から中央の点への向き)（arc_points の cross(chord, arch_dir) と同じ向き）
+    chord = _normalize(points[..., -1, :] - points[..., 0, :])
+    middle = _normalize(points[..., points.shape[-2] // 2, :] - points[..., 0, :])
+    plane = np.cross(chord, middle)
+    curved = np.linalg.norm(plane, axis=-1, keepdims=True) > 1e-6
+    up = np.where(np.abs(chord[..., 2:3]) < 0.9, [0.0, 0.0, 1.0], [1.0, 0.0, 0.0])
+    binormal = _normalize(np.where(curved, plane, np.cross(chord, up)))[..., None, :]
+    # 接線は面の中にあるので binormal と直交する
+    normal = np.cross(binormal, tangent)
+    binormal = np.broadcast_to(binormal, normal.shape)
+
+    theta = np.linspace(0.0, 2 * math.pi, sides + 1)
+    ring = (np.cos(theta)[:, None] * normal[..., None, :] + np.sin(theta)[:, None] * binormal[..., None, :])
+    return points[..., :, None, :] + radii[..., None, None, None] * ring
+
+
+def tube_faces(num_points, sides=12):
+    """
+    tube_vertices() の頂点（1本分を平らに並べたもの）から作る三角形の頂点番号 (F, 3)
+    """
+    row = sides + 1
+    i, j = np.meshgrid(np.arange(num_points - 1), np.arange(sides), indexing="ij")
+    a = (i * row + j).ravel()
+    b, c, d = a + 1, a + row, a + row + 1
+    return np.concatenate([np.stack([a, b, c], axis=-1), np.stack([b, d, c], axis=-1)])
+
+
+def evaluate_muscles(muscles, anchors):
+    """
+    ArtificialMuscle のリストとアンカー座標 [(p1, p2), ...] から形状をまとめて計算する
+    """
+    segments = {m.segments for m in muscles}
+    if len(segments) != 1:
+        raise ValueError("all muscles must have the same number of segments")
+    p1 = np.array([a[0] for a in anchors], dtype=float)
+    p2 = np.array([a[1] for a in anchors], dtype=float)
+    return evaluate(
+        p1, p2,
+        [m.contraction_ratio for m in muscles],
+        [m.diameter for m in muscles],
+        segments.pop(),
+        [m.radial_expansion - 1.0 for m in muscles],
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="収縮率・アンカー配置のスイープ")
+    parser.add_argument("--configs", type=int, default=10000, help="評価する配置の数")
+    parser.add_argument("--segments", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    p1 = rng.uniform(-50, 50, (args.configs, 3))
+    p2 = p1 + rng.uniform(50, 150, (args.configs, 1)) * _normalize(rng.normal(size=(args.configs, 3)))
+    contraction = rng.uniform(0, 1, args.configs)
+
+    start = time.perf_counter()
+    geometry = evaluate(p1, p2, contraction, 5.0, args.segments)
+    elapsed = time.perf_counter() - start
+
+    arc_length = geometry.lengths.sum(axis=-1)
+    print(f"{args.configs} 配置 x {args.segments} セグメント: {elapsed * 1000:.1f} ms")
+    print(f"円弧長 / アンカー間距離: 平均 {np.mean(arc_length / np.linalg.norm(p2 - p1, axis=-1)):.4f}")
+
+    # 管のメッシュの隣り合う断面が、中心線の曲がり（接線の回転）以上に回っていないか
+    # 断面が裏返ると頂点が半径の 2 倍近くずれる
+    rings = tube_vertices(geometry.points, geometry.radii) - geometry.points[..., None, :]
+    shift = np.linalg.norm(np.diff(rings, axis=-3), axis=-1).max(axis=-1) / geometry.radii[..., None]
+    tangent = _normalize(np.gradient(geometry.points, axis=-2))
+    bend = 2 * np.sin(np.arccos(np.clip(np.sum(tangent[..., 1:, :] * tangent[..., :-1, :], axis=-1), -1.0, 1.0)) / 2)
+    twist = np.abs(shift - bend).max()
+    print(f"隣り合う断面のねじれ / 半径: 最大 {twist:.2e}")
+    if twist > 1e-6:
+        raise SystemExit("tube_vertices: 隣り合う断面がねじれています")
@@ -0,0 +1,222 @@
+"""
+McKibben 型人工筋肉の物理モデル（NumPy だけで動く）
+
+- 編み角と Chou–Hannaford の式による 力・圧力・長さ の関係
+- 体積変化を含む内圧の変化（等温、バルブの流量はコンダクタンスに比例）
+- 負荷の質量と直列の減衰
+
+パラメータは全て配列にできるので、たくさんの筋肉・たくさんのパラメータの組を1回の配列演算でまとめて進めます。
+単位は SI（m, Pa, N, kg, s）、圧力はゲージ圧です。
+
+    python muscle_physics.py --muscles 1000 --duration 10
+"""
+
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+ATMOSPHERIC_PRESSURE = 101325.0  # Pa
+GAS_CONSTANT_AIR = 287.05  # J/(kg K)
+TEMPERATURE = 293.15  # K
+
+MuscleState = namedtuple("MuscleState", ["pressure", "length", "velocity"])
+SimulationResult = namedtuple("SimulationResult", ["times", "pressure", "length", "contraction", "force"])
+
+
+class McKibbenModel:
+    """
+    McKibben 型人工筋肉のモデル
+
+    編みひもの長さ b と巻き数 n は一定で、編み角 θ が変わると
+        長さ L = b cosθ、直径 D = b sinθ / (nπ)
+    になります。Chou–Hannaford の式より、張力は
+        F = P (π D0² / 4) (3 cos²θ - 1) / sin²θ0
+    で、cos²θ = 1/3 になると 0 になります（これが最大収縮率）。
+    """
+    def __init__(self, length, diameter, braid_angle=math.radians(20), load_mass=0.5, damping=50.0,
+                 external_force=10.0, supply_pressure=0.5e6, valve_conductance=5e-10):
+        """
+        Args:
+            length: 自然長 L0 (m)
+            diameter: 自然長での直径 D0 (m)
+            braid_angle: 自然長での編み角 θ0 (rad)
+            load_mass: 負荷の質量 (kg)
+            damping: 直列の減衰係数 (N s/m)
+            external_force: 筋肉を引き伸ばす向きの外力 (N)
+            supply_pressure: 供給圧（ゲージ圧、Pa）
+            valve_conductance: バルブの流量係数（質量流量 = 係数 x 圧力差、kg/(s Pa)）
+        """
+        (self.length, self.diameter, self.braid_angle, self.load_mass, self.damping,
+         self.external_force, self.supply_pressure, self.valve_conductance) = np.broadcast_arrays(
+            *(np.asarray(v, dtype=float) for v in (
+                length, diameter, braid_angle, load_mass, damping,
+                external_force, supply_pressure, valve_conductance))
+        )
+        self.shape = self.length.shape
+
+        cos0 = np.cos(self.braid_angle)
+        sin0 = np.sin(self.braid_angle)
+        # 編みひもの長さ
+        self.thread_length = self.length / cos0
+        # F = P K (3cos²θ - 1)、V = K b sin²θ cosθ
+        self._k = math.pi * self.diameter ** 2 / 4 / sin0 ** 2
+        # 張力が 0 になる長さ（cosθ = 1/√3）
+        self.min_length = self.thread_length / math.sqrt(3)
+        self.max_contraction = 1.0 - self.min_length / self.length
+        # 最大収縮時の直径の膨張率 (sinθ / sinθ0)
+        self.radial_expansion = math.sqrt(2.0 / 3.0) / sin0
+
+    def _cos(self, length):
+        return np.clip(length / self.thread_length, 0.0, 1.0)
+
+    def force(self, pressure, length):
+        """
+        内圧と長さから張力 (N) を計算する
+        """
+        cos = self._cos(length)
+        return pressure * self._k * (3 * cos ** 2 - 1)
+
+    def volume(self, length):
+        """
+        長さから内部の体積 (m³) を計算する
+        """
+        cos = self._cos(length)
+        return self._k * self.thread_length * (1 - cos ** 2) * cos
+
+    def diameter_at(self, length):
+        """
+        長さから直径 (m) を計算する
+        """
+        cos = self._cos(length)
+        return self.diameter * np.sqrt(1 - cos ** 2) / np.sin(self.braid_angle)
+
+    def contraction(self, length):
+        """
+        収縮率（0.0 ~ 1.0、1.0 が最大収縮）。ArtificialMuscle.set_contraction() にそのまま渡せます
+        """
+        return np.clip((1.0 - length / self.length) / self.max_contraction, 0.0, 1.0)
+
+    def initial_state(self):
+        zeros = np.zeros(self.shape)
+        return MuscleState(pressure=zeros, length=self.length.copy(), velocity=zeros.copy())
+
+    def step(self, state, pressure_command, dt):
+        """
+        状態を dt 秒進める（半陰的オイラー法）
+
+        Args:
+            state (MuscleState): 今の状態
+            pressure_command: 目標圧（ゲージ圧、Pa、供給圧で頭打ち）
+            dt (float): 時間刻み (s)
+
+        Returns:
+            MuscleState: dt 秒後の状態
+        """
+        pressure, length, velocity = state
+        command = np.clip(pressure_command, 0.0, self.supply_pressure)
+        cos = self._cos(length)
+
+        # 運動方程式: M dv/dt = 外力 - 張力 - 減衰
+        force = pressure * self._k * (3 * cos ** 2 - 1)
+        velocity = velocity + (self.external_force - force - self.damping * velocity) / self.load_mass * dt
+        new_length = length + velocity * dt
+
+        # 最大収縮（張力 0）と自然長で止める
+        clipped = np.clip(new_length, self.min_length, self.length)
+        velocity = np.where(clipped != new_length, 0.0, velocity)
+
+        # 内圧: (P + Patm) V = m R T を微分して dP/dt = (R T dm/dt - (P + Patm) dV/dt) / V
+        dv_dl = self._k * (1 - 3 * cos ** 2)
+        mass_flow = self.valve_conductance * (command - pressure)
+        volume = np.maximum(self.volume(length), 1e-12)
+        dp = (GAS_CONSTANT_AIR * TEMPERATURE * mass_flow
+              - (pressure + ATMOSPHERIC_PRESSURE) * dv_dl * velocity) / volume
+        pressure = np.maximum(pressure + dp * dt, 0.0)
+
+        return MuscleState(pressure=pressure, length=clipped, velocity=velocity)
+
+    def simulate(self, pressure_command, duration, dt=1e-3, state=None, record_every=10):
+        """
+        duration 秒ぶんまとめてシミュレーションする
+
+        Args:
+            pressure_command: 目標圧の配列、または (時刻, 状態) を受け取って目標圧を返す関数
+            duration (float): シミュレーションする時間 (s)
+            dt (float): 時間刻み (s)
+            state (MuscleState): 初期状態（省略時は自然長・大気圧）
+            record_every (int): この刻み数ごとに記録する
+
+        Returns:
+            (SimulationResult, MuscleState): 記録した履歴と最後の状態
+        """
+        if state is None:
+            state = self.initial_state()
+        steps = int(round(duration / dt))
+        records = []
+        for i in range(steps):
+            t = i * dt
+            command = pressure_command(t, state) if callable(pressure_command) else pressure_command
+            state = self.step(state, command, dt)
+            if (i + 1) % record_every == 0 or i == steps - 1:
+                records.append(((i + 1) * dt, state))
+
+        times = np.array([t for t, _ in records])
+        pressure = np.stack([s.pressure for _, s in records])
+        length = np.stack([s.length for _, s in records])
+        result = SimulationResult(
+            times=times,
+            pressure=pressure,
+            length=length,
+            contraction=self.contraction(length),
+            force=self.force(pressure, length),
+        )
+        return result, state
+
+
+def drive(muscles, model, state):
+    """
+    シミュレーションの状態を ArtificialMuscle のリストに反映する（形状の表示用）
+
+    model の最大収縮率と半径の膨張率もそれぞれの筋肉に設定します。
+    元の値には戻さないので、モデルでの駆動をやめる時は呼び出し側で保存しておいた値に戻してください。
+    """
+    ratios = model.contraction(state.length)
+    max_contraction = np.broadcast_to(model.max_contraction, ratios.shape)
+    expansion = np.broadcast_to(model.radial_expansion, ratios.shape)
+    for i, muscle in enumerate(muscles):
+        muscle.max_contraction = float(max_contraction[i])
+        muscle.radial_expansion = float(expansion[i])
+        muscle.set_contraction(float(ratios[i]))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="McKibben 型人工筋肉のバッチシミュレーション")
+    parser.add_argument("--muscles", type=int, default=1000, help="同時にシミュレーションする筋肉（パラメータの組）の数")
+    parser.add_argument("--duration", type=float, default=10.0, help="シミュレーションする時間 (s)")
+    parser.add_argument("--dt", type=float, default=1e-3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    model = McKibbenModel(
+        length=0.1,
+        diameter=0.01,
+        braid_angle=np.radians(rng.uniform(15, 30, args.muscles)),
+        damping=rng.uniform(20, 100, args.muscles),
+        external_force=rng.uniform(0, 30, args.muscles),
+    )
+    # 1 Hz の矩形波で 0 と供給圧を切り替える
+    period = 1.0
+    command = lambda t, state: model.supply_pressure * ((t % period) < period / 2)
+
+    start = time.perf_counter()
+    result, _ = model.simulate(command, args.duration, dt=args.dt)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.muscles} 本 x {args.duration:.1f} s: {elapsed:.2f} s（実時間の {args.duration / elapsed:.1f} 倍）")
+    print(f"最大収縮率: 平均 {model.max_contraction.mean():.3f}")
+    print(f"到達した収縮率: 平均 {result.contraction.max(axis=0).mean():.3f}")
@@ -13,22 +13,20 @@ function stealMoekaVoice() {
         if (window.lastSentMessage !== latestMessage) {
             console.log("★新しい萌夏の声を検知:", latestMessage);
             
-            // ここでJSONが含まれているかチェックして、あれば抽出
-            if (latestMessage.includes('{') && latestMessage.includes('}')) {
-                console.log("-> JSONデータを発見！これをLINE転送に回すわ。");
-                // 【次のステップ】ここでPythonサーバーへ飛ばす処理を入れる
-                sendToPython(latestMessage)
-            }
+            // JSON かどうかの判定と中身の確認は Python 側でやるので、新しい発言はそのまま送る
+            // 検知した時刻も送って、サーバー側で同じメッセージの二重送信を見分けてもらう
+            sendToPython(latestMessage, Date.now())
             window.lastSentMessage = latestMessage;
         }
     }
 }
 
-function sendToPython(text) {
+function sendToPython(text, timestamp) {
     fetch('http://localhost:5000/moeka', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: text })
+        // source はサーバー側で書きかけの返答が落ち着くのを待つ単位（会話ごと）
+        body: JSON.stringify({ message: text, timestamp: timestamp, source: location.pathname })
     })
     .then(response => console.log('Pythonへ転送完了！'))
     .catch(error => console.error('Pythonが寝てるみたいよ:', error));
@@ -1,47 +1,249 @@
-import requests
-from flask import Flask, request, jsonify
-from flask_cors import CORS # 拡張機能からの通信を許可するために必要
-
-
-app = Flask(__name__)
-CORS(app) # これを忘れるとブラウザが「セキュリティ違反！」って怒るわよ
-
-def send_moeka_line(message):
-    # ここにあんたが発行したトークンとユーザーIDを入れるのよ！
-    access_token = '0IesX8uQUoAxN9S6qc8rt/ux++flZLz7VfLdD3uLKwkJCPLxDy7Hsf55dGOcgHSjNCiuSuOBTRLnuWwN09ZzfHGZgm17r2qmY8T4No6f4ViUKM8KiMOBnl5egasuTddw3eu8/NrFU8UJ7HpIV2DQjAdB04t89/1O/w1cDnyilFU='
-    user_id = 'U115193d3673c5b833e6e6424d70cd5aa'
-    
-    url = 'https://api.line.me/v2/bot/message/push'
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {access_token}'
-    }
-    data = {
-        'to': user_id,
-        'messages': [{'type': 'text', 'text': f'\n{message}'}]
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
-        print("今度こそ、あんたのスマホに届いたはずよ！")
+import asyncio
+import os
+import sys
+from pathlib import Path
+from aiohttp import web
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+from bot_common.debounce import Debouncer, RecentContent
+from bot_common.line_push import MAX_MESSAGES_PER_PUSH, LinePushRejected, LinePushSender, text_message
+from bot_common.outbox import DeliveryRejected, Outbox, idempotency_key
+from bot_common.structured import JSON_START, PayloadError, extract_json, validate_commands
+
+# 拡張機能からの通信を許可するために必要（これを忘れるとブラウザが「セキュリティ違反！」って怒るわよ）
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+}
+
+# ここにあんたが発行したトークンとユーザーIDを入れるのよ！
+ACCESS_TOKEN = '0IesX8uQUoAxN9S6qc8rt/ux++flZLz7VfLdD3uLKwkJCPLxDy7Hsf55dGOcgHSjNCiuSuOBTRLnuWwN09ZzfHGZgm17r2qmY8T4No6f4ViUKM8KiMOBnl5egasuTddw3eu8/NrFU8UJ7HpIV2DQjAdB04t89/1O/w1cDnyilFU='
+USER_ID = 'U115193d3673c5b833e6e6424d70cd5aa'
+
+# 送信先の API（動作確認の時は python -m bot_common.fake_line のURLにする）
+LINE_API_BASE_URL = os.getenv('LINE_API_BASE_URL', 'https://api.line.me')
+
+# 送れるまで消さない送信箱（落ちても再起動しても LINE に届くまで再送するわ）
+OUTBOX_PATH = 'line_outbox.sqlite3'
+
+# 拡張機能は3秒おきに書きかけの返答も送ってくるので、内容がこの秒数変わらなくなってから送る
+SETTLE_SECONDS = 4.0
+# 同じ内容はこの秒数の間は1回しか送らない（ページを開き直した時の再送など）
+DEDUPE_TTL = 600
+
+# 接続は使い回して、送信待ちは最大5件まで1回のプッシュにまとめる
+sender = LinePushSender(ACCESS_TOKEN, USER_ID, base_url=LINE_API_BASE_URL)
+outbox = None  # サーバーの起動時に開く
+
+# 受け付けたメッセージの行き先ごとの件数
+relay_stats = {'text': 0, 'flex': 0, 'action': 0, 'ignored': 0, 'rejected': 0}
+
+# type が "action" のコマンドで呼ぶローカルの処理（LINE には送らない）
+ACTION_HOOKS = {}
+
+def action_hook(name):
+    """
+    {"type": "action", "action": name, "params": {...}} を受けた時に呼ぶ async 関数を登録する
+    """
+    def register(func):
+        ACTION_HOOKS[name] = func
+        return func
+    return register
+
+@action_hook('log')
+async def log_action(params):
+    print(f"萌夏からのアクション: {params}")
+
+def outbox_row(message, timestamp=None, key_text=None):
+    # 拡張機能が同じメッセージを送り直しても、本文とタイムスタンプが同じなら1回しか送らない
+    # message は LINE のメッセージオブジェクトか、ただのテキスト
+    if isinstance(message, str):
+        key_text, message = key_text or message, text_message(f'\n{message}')
+    return idempotency_key(key_text, timestamp), message
+
+async def send_moeka_line(message, timestamp=None, key_text=None):
+    # 送信箱に書き込むだけですぐ戻る（実際の送信と 429 の再送はバックグラウンドでやるわ）
+    return await outbox.add(*outbox_row(message, timestamp, key_text))
+
+def parse_commands(message):
+    """
+    メッセージに埋め込まれた JSON を取り出して検証する
+
+    Returns:
+        list: コマンドのリスト（JSON が無ければ None）
+
+    Raises:
+        PayloadError: JSON の形式が正しくない場合
+    """
+    value = extract_json(message)
+    if value is None:
+        if JSON_START.search(message):
+            raise PayloadError("embedded JSON could not be parsed")
+        return None
+    if isinstance(value, dict) and 'type' not in value and 'messages' not in value:
+        # type の無い JSON は今まで通りメッセージ全体をテキストとして送る
+        value = {'type': 'text', 'text': message}
+    return validate_commands(value)
+
+def route_message(message, timestamp):
+    """
+    メッセージを送信箱の行とローカルのアクションに振り分ける
+
+    Returns:
+        (list, list): 送信箱に入れる (キー, ペイロード) と、呼ぶ (フック, params)
+    """
+    try:
+        commands = parse_commands(message)
+    except PayloadError as e:
+        # LINE に送る前にここで落とす
+        relay_stats['rejected'] += 1
+        print(f"この JSON は送れないわ: {e}")
+        return [], []
+    if commands is None:
+        relay_stats['ignored'] += 1
+        return [], []
+
+    rows, actions = [], []
+    for index, command in enumerate(commands):
+        relay_stats[command['type']] += 1
+        key_text = f"{index}\n{message}"
+        if command['type'] == 'text':
+            rows.append(outbox_row(command['text'], timestamp, key_text=key_text))
+        elif command['type'] == 'flex':
+            rows.append(outbox_row(
+                {'type': 'flex', 'altText': command['altText'], 'contents': command['contents']},
+                timestamp, key_text=key_text
+            ))
+        else:
+            hook = ACTION_HOOKS.get(command['action'])
+            if hook is None:
+                print(f"知らないアクションよ: {command['action']}")
+                continue
+            actions.append((hook, command['params']))
+    return rows, actions
+
+async def send_settled(message, timestamp, keys):
+    # keys は受け付けた時に送信箱に書いた 'settling' の行（書きかけの分も含む）
+    # 振り分けた結果の行と入れ替えるまで消さないので、途中で落ちても次の起動時にやり直せる
+    if recent.seen(message):
+        print("同じ内容はもう送ったわ")
+        await outbox.settle(keys, [])
+        return
+    rows, actions = route_message(message, timestamp)
+    await outbox.settle(keys, rows)
+
+    for hook, params in actions:
+        try:
+            await hook(params)
+        except Exception as e:
+            print("Error in action hook:", e)
+
+debouncer = Debouncer(send_settled, settle=SETTLE_SECONDS)
+recent = RecentContent(ttl=DEDUPE_TTL)
+
+async def deliver(messages, batch_key):
+    # 送信箱の同じ行の組の再送には同じ再送キーが付くので、LINE 側で二重に届かない
+    # （本文から作ると、同じ文面の別のメッセージが 409 で捨てられてしまう）
+    try:
+        return await sender.push(messages, retry_key=batch_key)
+    except LinePushRejected as e:
+        raise DeliveryRejected(str(e)) from e
+
+async def receive_message(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.json_response({"status": "error", "reason": "invalid json"}, status=400, headers=CORS_HEADERS)
+
+    # 1件なら {"message": ...}、まとめて送る時は [{"message": ...}, ...] か {"messages": [...]}
+    if isinstance(data, dict):
+        items = data.get('messages', [data])
     else:
-        print(f"エラーよ！: {response.text}")
+        items = data
+    if not isinstance(items, list) or not all(
+        isinstance(item, dict) and isinstance(item.get('message', ''), str) for item in items
+    ):
+        return web.json_response({"status": "error", "reason": "invalid payload"}, status=400, headers=CORS_HEADERS)
+
+    accepted = []
+    for item in items:
+        message = item.get('message', '')
+        if not message:
+            continue
+        if not JSON_START.search(message):
+            # JSON を含まない返答は転送しない（書きかけでも { か [ は最初の方に出てくる）
+            relay_stats['ignored'] += 1
+            continue
+        print(f"\n★萌夏からの受信成功: \n{message}")
+
+        # ここに「LINE Messaging APIに飛ばす処理」を書き足せば完成よ！
+        # 銭湯帰りのあんたへ
+        #send_moeka_line("お風呂上がりでボーっとしてるんじゃないわよ！最新のAPIで繋ぎ直したわ。聞こえる？")
+        timestamp = item.get('timestamp')
+        payload = {'message': message, 'timestamp': timestamp, 'source': item.get('source') or request.remote}
+        accepted.append((idempotency_key(f"settling\n{message}", timestamp), payload))
+
+    # 応答する前に送信箱に書いておく（落ち着くのを待っている間に落ちても、次の起動時に続きから）
+    inserted = await asyncio.gather(*(outbox.add(key, payload, status='settling') for key, payload in accepted))
+    count = duplicates = 0
+    for (key, payload), ok in zip(accepted, inserted):
+        if not ok:
+            duplicates += 1
+            continue
+        # 送信元（タブ）ごとに、書きかけの返答が落ち着くのを待ってから送信待ちにする
+        debouncer.offer(payload['source'], payload['message'], payload['timestamp'], key)
+        count += 1
+
+    # LINE の応答は待たずに受け付けたことだけ返す
+    status = "duplicate" if duplicates and not count else "accepted"
+    return web.json_response(
+        {"status": status, "count": count, "duplicates": duplicates}, status=202, headers=CORS_HEADERS
+    )
+
+async def stats(request):
+    # 送信待ちの件数と、受け付けてから届くまでの遅れ
+    return web.json_response({
+        "relay": relay_stats,
+        "settling": debouncer.pending(),
+        "outbox": await asyncio.to_thread(outbox.stats),
+        "sender": sender.stats,
+    }, headers=CORS_HEADERS)
+
+async def preflight(request):
+    return web.Response(headers=CORS_HEADERS)
 
-@app.route('/moeka', methods=['POST'])
-def receive_message():
-    data = request.json
-    message = data.get('message', '')
+async def start_sender(app):
+    global outbox
+    outbox = Outbox(OUTBOX_PATH)
+    # 前回、落ち着くのを待っている間に止まった分を待ち直す
+    for key, payload in await asyncio.to_thread(outbox.settling):
+        debouncer.offer(payload['source'], payload['message'], payload['timestamp'], key)
+    app['line_delivery'] = asyncio.create_task(outbox.run(deliver, batch_size=MAX_MESSAGES_PER_PUSH))
 
-    print(f"\n★萌夏からの受信成功: \n{message}")
+async def stop_sender(app):
+    # 落ち着くのを待っている分は送信待ちにしてから止める
+    # 送れていない分は送信箱に残っているので、次に起動した時に送るわ
+    await debouncer.flush()
+    app['line_delivery'].cancel()
+    await sender.close()
+    outbox.close()
 
-    # ここに「LINE Messaging APIに飛ばす処理」を書き足せば完成よ！
-    # 銭湯帰りのあんたへ
-    #send_moeka_line("お風呂上がりでボーっとしてるんじゃないわよ！最新のAPIで繋ぎ直したわ。聞こえる？")
-    send_moeka_line(message)
+def add_routes(app):
+    """
+    /moeka のルートを aiohttp のアプリに追加する（Mona の Webhook サーバーと同居させる時用）
+    """
+    app.router.add_post('/moeka', receive_message)
+    app.router.add_route('OPTIONS', '/moeka', preflight)
+    app.router.add_get('/moeka/stats', stats)
+    app.on_startup.append(start_sender)
+    app.on_cleanup.append(stop_sender)
 
-    return jsonify({"status": "success"}), 200
+def create_app():
+    app = web.Application()
+    add_routes(app)
+    return app
 
 if __name__ == '__main__':
     # 5000番ポートで待機
-    #app.run(port=5000, debug=False)
-    app.run(host='0.0.0.0', port=5000)
+    web.run_app(create_app(), host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import sys
 import asyncio
 import time
 import re
@@ -8,8 +9,6 @@ import nest_asyncio
 nest_asyncio.apply()
 import requests
 import json
-import tempfile
-import winsound
 import io
 import wave
 import subprocess
@@ -26,21 +25,92 @@ from datetime import datetime
 from zoneinfo import ZoneInfo
 from telegram.error import Conflict
 
-chat_history_flag = True
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from bot_common.audio_cache import AudioCache
+from bot_common.conversation import ConversationStore
+from bot_common.emotion import describe_trend, lexicon_score, parse_score
+from bot_common.gemini import GeminiClient
+from bot_common.metrics import span, start_metrics_server, traced
+from bot_common.prompts import PromptRegistry
+from bot_common.scheduler import ProactiveScheduler, TokenBucket
+from bot_common.sessions import SessionManager
+from bot_common.summarizer import RollingSummarizer
+from bot_common.tts import VoicevoxClient, VoicevoxSpeaker
+from bot_common.webhook import create_webhook_server, serve_webhook, webhook_path
+
+# 要約を更新する閾値（未要約のターン数か文字数のどちらかを超えたら更新）
+SUMMARY_MIN_TURNS = 6
+SUMMARY_MIN_CHARS = 600
+
+# Geminiへの同時リクエスト数の上限
+GEMINI_MAX_CONCURRENCY = 4
+
+# レート制限（1分あたりの回数）
+GEMINI_REQUESTS_PER_MINUTE = 60
+TELEGRAM_SENDS_PER_MINUTE = 30
+
+# 定期メッセージの間隔（秒）とスケジューラの確認間隔（秒）
+SMALL_TALK_MIN_INTERVAL = 3600
+SMALL_TALK_MAX_INTERVAL = 7200
+SCHEDULER_TICK = 60
+
+# 同じ入力に対する感情スコアを使い回す秒数
+EMOTION_CACHE_TTL = 600
+
+# 気分が下がっている時・低い時は定期メッセージの間隔をこの倍率で短くする
+FALLING_MOOD_INTERVAL_FACTOR = 0.5
+LOW_MOOD_INTERVAL_FACTOR = 0.75
+LOW_MOOD_SCORE = 4
+
+# 会話履歴の設定（チャットごとのターン数上限とプロンプトに入れるトークン数上限）
+HISTORY_MAX_TURNS = 50
+HISTORY_TOKEN_BUDGET = 1200
+
+# メモリに保持するセッション数の上限（超えた分は古い順にディスクへ退避）
+MAX_ACTIVE_SESSIONS = 200
+
+# 処理段階ごとの所要時間を返すメトリクスのエンドポイント（http://127.0.0.1:9101/metrics）
+METRICS_PORT = 9101
+
+# Webhook モード（MONA_WEBHOOK_URL を設定すると run_polling の代わりに Webhook で受ける）
+# Telegram の更新と LINE の中継 (/moeka) を同じサーバーで受けるので、ポートは拡張機能の送り先に合わせる
+WEBHOOK_URL = os.getenv("MONA_WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("MONA_WEBHOOK_SECRET")
+WEBHOOK_PORT = 5000
+WEBHOOK_WORKERS = 8
+
+# 最初から登録しておくチャット（旧 chat_history.txt / summary.txt の持ち主）
+OWNER_CHAT_ID = '351535857'
+
+# プロンプトファイル（更新時刻が変わった時だけ読み直す）
+PROMPT_FILES = {
+    "master": "master_simple.txt",
+    "small_talk": "small_talk.txt",
+    "summarize": "summarize.txt",
+    "emotion": "emotion.txt",
+}
+
+# 日付を直書きしている旧形式のプロンプト用
+DATE_LINE_PATTERN = re.compile(r"^- 現在の日付は.*$", re.MULTILINE)
 
 logging.getLogger('telegram').setLevel(logging.CRITICAL)
 logging.getLogger('telegram.ext').setLevel(logging.CRITICAL)
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
-def replace_line_in_file(filename, target_string, new_line):
-    with open(filename, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-
-    for i, line in enumerate(lines):
-        if target_string in line:
-            lines[i] = new_line + '\n'  # 必要に応じて改行を追加
+def build_master_prompt():
+    """
+    マスタープロンプトを (固定部分, 現在の日付の行) に分けて返す（ファイルへの書き込みはしない）
+    固定部分は Gemini のコンテキストキャッシュに載せるので、毎分変わる日付の行は外に出す
+    """
+    now = datetime.now(ZoneInfo("Asia/Tokyo"))
+    cur_date_and_time = f'{now.year}年{now.month}月{now.day}日{now.hour}時{now.minute}分'
+    # 日付を直書きした旧形式のプロンプトはその行を取り除く（日付は毎回 date_line で渡す）
+    master = DATE_LINE_PATTERN.sub('', prompts.get("master"), count = 1)
+    return master, f'- 現在の日付は{cur_date_and_time}\n'
 
-    with open(filename, 'w', encoding='utf-8') as file:
-        file.writelines(lines)
+def is_active_hour(now):
+    # 2時〜8時台は寝ているので定期メッセージを送らない
+    return 8 < now.hour or now.hour < 2
 
 async def random_generator_loop():
     while True:
@@ -49,56 +119,6 @@ async def random_generator_loop():
         # 何か処理を書く
         await asyncio.sleep(10)  # 10秒の待機（適宜調整）
 
-def voicevox_synthesize_and_play(text, speaker=4, speedScale = 0.8, pitchScale=1.0, intonationScale=0.5):
-    """
-    VoicevoxのAPIを使って音声合成し、そのまま再生します。
-    
-    Args:
-        text (str): 読み上げたいテキスト
-        speaker (int): 声のキャラクターID
-        speedScale (float): 話す速度（0.5〜2.0など）
-        pitchScale (float): 声の高さ（-1.0〜1.0など）
-        intonationScale (float): 抑揚（0.0〜2.0）
-    """
-    host = "localhost"
-    port = 50021
-
-    # 1. 音声合成用クエリを作成
-    query_params = {
-        "text": text,
-        "speaker": speaker
-    }
-    res_query = requests.post(f"http://{host}:{port}/audio_query", params=query_params)
-    if res_query.status_code != 200:
-        print("Error in audio_query:", res_query.text)
-        return
-    
-    query_json = res_query.json()
-
-    # クエリのパラメータを変更（速度・高さ・抑揚など）
-    query_json["speedScale"] = speedScale
-    query_json["pitchScale"] = pitchScale
-    query_json["intonationScale"] = intonationScale
-    query_json["prePhonemeLength"] = 0.1  # 発声前の無音秒数調整（任意）
-    query_json["postPhonemeLength"] = 0.1  # 発声後の無音秒数調整（任意）
-
-    # 2. 合成音声生成リクエスト
-    headers = {"Content-Type": "application/json"}
-    res_synthesis = requests.post(f"http://{host}:{port}/synthesis", params={"speaker": speaker}, headers=headers, data=json.dumps(query_json))
-    if res_synthesis.status_code != 200:
-        print("Error in synthesis:", res_synthesis.text)
-        return
-
-    # 3. バイト列を一時ファイルに保存
-    audio_bytes = res_synthesis.content
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmpfile:
-        tmpfile.write(audio_bytes)
-        tmpfile.flush()
-        tmp_filename = tmpfile.name
-
-    # 4. winsoundで再生
-    winsound.PlaySound(tmp_filename, winsound.SND_FILENAME)
-
 def get_speakers():
     url = "http://localhost:50021/speakers"  # Voicevoxが動いているAPIエンドポイント
     response = requests.get(url)
@@ -113,126 +133,115 @@ def get_speakers():
     else:
         print(f"Error: {response.status_code}")
 
-async def summarize_conversation():
-    with open("summarize.txt", "r", encoding="utf-8") as file:
-        summarize = file.read()
-    with open("chat_history.txt", "r", encoding="utf-8") as file:
-        chat_history = file.read()
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents = summarize + chat_history
-    )
-    print("\n", response.text)
-    with open("summary.txt", "w", encoding="utf-8") as f:
-        f.write(response.text)
+def small_talk_interval_factor(chat_id):
+    session = sessions.peek(chat_id)
+    if session is None :
+        return 1.0
+    trend = session.emotion.trend()
+    if trend["direction"] == "falling" :
+        return FALLING_MOOD_INTERVAL_FACTOR
+    if trend["count"] > 0 and trend["ewma"] <= LOW_MOOD_SCORE :
+        return LOW_MOOD_INTERVAL_FACTOR
+    return 1.0
 
 async def read_emotion( input_message ):
-    with open("emotion.txt", "r", encoding="utf-8") as file:
-        emotion = file.read()
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents = emotion + input_message
-    )
-    print("\n", response.text)
-    #await update.message.reply_text(f"{response.text}")
+    # 感情語がはっきりしているメッセージは辞書で採点して Gemini を呼ばない
+    score, confident = lexicon_score( input_message )
+    if confident :
+        print("\n emotion score (local):", score)
+        return score
+
+    emotion = prompts.get("emotion")
+    emotion_text = await gemini.generate( emotion + input_message, cache_ttl = EMOTION_CACHE_TTL )
+    print("\n", emotion_text)
+    #await update.message.reply_text(f"{emotion_text}")
+    return parse_score( emotion_text )
 
 # メッセージを受け取ったときの処理関数
+@traced("echo", lambda update, context: update.effective_chat.id)
 async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
-    global chat_history_flag
-
     input_message = update.message.text  # 受け取ったテキスト
-    print(f"\n Received message:", input_message)
-
-    await read_emotion( input_message )
-
-    if input_message == "chat history on" :
-        chat_history_flag = True
-    elif input_message == "chat history off" :
-        chat_history_flag = False
-    else :
-        with open("chat_history.txt", "a", encoding="utf-8") as f:
-            f.write("[新の発言]:")
-            f.write(input_message)
-            f.write("\n")
-
-        with open("master_simple.txt", "r", encoding="utf-8") as file:
-            master = file.read()
-
-        with open("chat_history.txt", "r", encoding="utf-8") as file:
-            raw_text = file.read()
-
-        if len( raw_text ) > 1200 :
-            chat_history = raw_text[-1200:] # 1200 letter FIFO
-            with open("chat_history.txt", "w", encoding="utf-8") as file:
-                file.write(chat_history)
-        else :
-            chat_history = raw_text
-
-        await summarize_conversation()
-        with open("summary.txt", "r", encoding="utf-8") as file:
-            summary = file.read()
-
-        if chat_history_flag :
-            #all_prompt = master + chat_history + input_message
-            all_prompt = master + summary + input_message 
-            #all_prompt = master + summary 
-        else :
-            all_prompt = master + input_message
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents = all_prompt
-        )
-        print("\n", response.text)
-
-        with open("chat_history.txt", "a", encoding="utf-8") as f:
-            f.write("[萌夏の発言]:")
-            f.write(response.text)
-            f.write("\n")
-
-        await update.message.reply_text(f"{response.text}")
+    chat_id = update.effective_chat.id
+    # 処理中（ロック待ちの間も）はセッションをメモリから外さない
+    with sessions.using(chat_id) as session :
+        # polling では concurrent_updates で更新が並列に来るので、同じチャットの中では1件ずつ順番に処理する
+        async with session.lock :
+            summarizer = session.summarizer
+            print(f"\n Received message:", input_message)
+
+            if input_message == "chat history on" :
+                session.chat_history_flag = True
+                await read_emotion( input_message )
+            elif input_message == "chat history off" :
+                session.chat_history_flag = False
+                await read_emotion( input_message )
+            else :
+                # 要約にまだ入っていない直近のターン（萌夏の返答も含む。今回の入力は後ろに別に付ける）
+                recent_turns = summarizer.unfolded(HISTORY_TOKEN_BUDGET)
+                store.append(chat_id, "新", input_message)
+                summarizer.add_turn("新", input_message)
+
+                with span("prompt"):
+                    master, date_line = build_master_prompt()
+
+                    summary = summarizer.summary
+                    mood_line = describe_trend(session.emotion.trend())
+
+                    # master は prefix としてコンテキストキャッシュに載せるので、ここでは後ろに続く部分だけ組み立てる
+                    if session.chat_history_flag :
+                        #all_prompt = date_line + chat_history + input_message
+                        all_prompt = date_line + mood_line + summary + recent_turns + input_message 
+                        #all_prompt = date_line + summary 
+                    else :
+                        all_prompt = date_line + mood_line + input_message
+
+                # 感情スコアは返信に依存しないので返信生成と並列に投げる
+                score, reply_text = await asyncio.gather(
+                    read_emotion( input_message ),
+                    gemini.generate( all_prompt, prefix = master )
+                )
+                print("\n", reply_text)
+                if score is not None :
+                    session.emotion.append(score)
+
+                store.append(chat_id, "萌夏", reply_text)
+                summarizer.add_turn("萌夏", reply_text)
+                summarizer.maybe_fold()
+
+                with span("telegram.send"):
+                    await update.message.reply_text(f"{reply_text}")
+                speaker = 0 #四国めたん　あまあま
+                #speaker = 58 #猫使 ノーマル
+                #get_speakers()
+                voice.stream_and_play(reply_text, speaker, speedScale = 1.0, pitchScale = 0.0, intonationScale = 1.0)
+
+@traced("small_talk", lambda bot, chat_id: chat_id)
+async def send_small_talk(bot, chat_id):
+    with sessions.using(chat_id) as session :
+        with span("prompt"):
+            master, date_line = build_master_prompt()
+            seed_message = prompts.get("small_talk")
+
+            chat_history = store.render(chat_id)
+            mood_line = describe_trend(session.emotion.trend())
+
+            if session.chat_history_flag :
+                all_prompt = date_line + mood_line + chat_history + seed_message
+            else :
+                all_prompt = date_line + mood_line + seed_message
+
+        reply_text = await gemini.generate( all_prompt, prefix = master )
+        print("\n", reply_text)
+        await telegram_limiter.acquire()
+        with span("telegram.send"):
+            await bot.send_message( chat_id=chat_id, text = reply_text )
         speaker = 0 #四国めたん　あまあま
-        #speaker = 58 #猫使 ノーマル
-        #get_speakers()
-        voicevox_synthesize_and_play(response.text, speaker, speedScale = 1.0, pitchScale = 0.0, intonationScale = 1.0)
-
-async def scheduled_task(context: ContextTypes.DEFAULT_TYPE):
-
-    global chat_history_flag
-    chat_id = '351535857'
-
-    now = datetime.now(ZoneInfo("Asia/Tokyo"))
-    cur_date_and_time = f'- 現在の日付は{now.year}年{now.month}月{now.day}日{now.hour}時{now.minute}分'
-    replace_line_in_file('master_simple.txt', '- 現在の日付は', cur_date_and_time)
-
-    if 8 < now.hour or now.hour < 2 :
-
-        with open("master_simple.txt", "r", encoding="utf-8") as file:
-            master = file.read()
-
-        with open("small_talk.txt", "r", encoding="utf-8") as file:
-            seed_message = file.read()
-
-        with open("chat_history.txt", "r", encoding="utf-8") as file:
-            chat_history = file.read()
-
-        if chat_history_flag :
-            all_prompt = master + chat_history + seed_message
-        else :
-            all_prompt = master + seed_message
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents = all_prompt
-        )
-        print("\n", response.text)
-        await context.bot.send_message( chat_id=chat_id, text = response.text )
-        speaker = 0 #四国めたん　あまあま
-        voicevox_synthesize_and_play(response.text, speaker, speedScale = 1.0, pitchScale = 0.0, intonationScale = 1.0)
+        voice.stream_and_play(reply_text, speaker, speedScale = 1.0, pitchScale = 0.0, intonationScale = 1.0)
 
 async def main():
-    app = ApplicationBuilder().token("8373144974:AAE5ZMIPGZ740oqf4lSWm3cQyVKUyGRIXNw").build()
+    # Gemini待ちの間も他のチャットの更新を処理できるように並列処理を有効化（同じチャットの更新は echo の中で順番に処理する）
+    app = ApplicationBuilder().token("8373144974:AAE5ZMIPGZ740oqf4lSWm3cQyVKUyGRIXNw").concurrent_updates(GEMINI_MAX_CONCURRENCY).build()
 
     await app.initialize()
     # メッセージハンドラを登録（テキストメッセージのみ処理）
@@ -240,9 +249,28 @@ async def main():
 
     #time_target = datetime.time(hour = 23, minute = 4, second = 0, tzinfo=ZoneInfo('Asia/Tokyo'))
     #app.job_queue.run_daily(scheduled_task, time_target)
-    app.job_queue.run_repeating(scheduled_task, interval = random.randint( 3600, 7200 ))
-
-    await app.run_polling(drop_pending_updates=True)
+    # セッションごとにランダムな間隔で話しかける（静かな時間帯は送らない）
+    app.job_queue.run_repeating(scheduler.job, interval = SCHEDULER_TICK)
+
+    # 会話履歴はバックグラウンドでまとめてディスクへ書き出す
+    flusher = asyncio.create_task(store.run_flusher())
+    metrics_server = await start_metrics_server(port = METRICS_PORT)
+    try :
+        if WEBHOOK_URL :
+            # LINE の中継は Webhook サーバーに同居させる時だけ読み込む（Mona/ から実行した時だけ import できる）
+            from LINE import mona_line
+            server = create_webhook_server(
+                app, path = webhook_path(WEBHOOK_URL), secret_token = WEBHOOK_SECRET, workers = WEBHOOK_WORKERS
+            )
+            mona_line.add_routes(server)
+            await serve_webhook(app, server, WEBHOOK_URL, port = WEBHOOK_PORT, secret_token = WEBHOOK_SECRET)
+        else :
+            await app.run_polling(drop_pending_updates=True)
+    finally :
+        flusher.cancel()
+        await metrics_server.cleanup()
+        sessions.save_all()
+        store.flush()
     #try :
     #    await app.run_polling(drop_pending_updates=True)
     #    pass
@@ -250,8 +278,36 @@ async def main():
     #    pass
 
 if __name__ == "__main__":
+    # メッセージごとの処理時間の内訳を JSON 1行で出す
+    logging.basicConfig(level = logging.INFO, format = "%(message)s")
     api_key = os.getenv("GEMINI_API_KEY")
     client = genai.Client(api_key=api_key)
+    gemini_limiter = TokenBucket(rate = GEMINI_REQUESTS_PER_MINUTE / 60, capacity = GEMINI_MAX_CONCURRENCY)
+    telegram_limiter = TokenBucket(rate = TELEGRAM_SENDS_PER_MINUTE / 60, capacity = 5)
+    gemini = GeminiClient(client, max_concurrency = GEMINI_MAX_CONCURRENCY, rate_limiter = gemini_limiter)
+    store = ConversationStore(max_turns = HISTORY_MAX_TURNS, token_budget = HISTORY_TOKEN_BUDGET)
+    store.import_legacy(OWNER_CHAT_ID, "chat_history.txt")
+    prompts = PromptRegistry(PROMPT_FILES)
+    audio_cache = AudioCache()
+    voice = VoicevoxSpeaker(VoicevoxClient(cache = audio_cache))
+    sessions = SessionManager(
+        max_active = MAX_ACTIVE_SESSIONS,
+        store = store,
+        summarizer_factory = lambda chat_id, summary_path: RollingSummarizer(
+            gemini.generate, prompts, summary_path = summary_path,
+            min_turns = SUMMARY_MIN_TURNS, min_chars = SUMMARY_MIN_CHARS, max_pending = HISTORY_MAX_TURNS
+        )
+    )
+    scheduler = ProactiveScheduler(
+        send_small_talk, sessions.chat_ids,
+        min_interval = SMALL_TALK_MIN_INTERVAL, max_interval = SMALL_TALK_MAX_INTERVAL,
+        is_active_hour = is_active_hour,
+        interval_factor = small_talk_interval_factor
+    )
+    owner = sessions.get(OWNER_CHAT_ID)
+    if not owner.summarizer.summary and os.path.exists("summary.txt"):
+        with open("summary.txt", "r", encoding="utf-8") as file:
+            owner.summarizer.summary = file.read()
 
     #with open("master.txt", "r", encoding="utf-8") as file:
     #    master_prompt = file.read()
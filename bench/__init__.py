@@ -0,0 +1,3 @@
+"""
+ボットの性能測定用スクリプト
+"""
@@ -0,0 +1,67 @@
+"""
+言語判定のベンチマーク
+
+    python -m bench.bench_lang_router [--corpus bench/corpus/replies.jsonl] [--repeat 2000]
+
+過去の返信コーパスに対して、旧 detect_language() と lang_router の判定結果と処理時間を比較します。
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bot_common.lang_router import classify, segment
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "replies.jsonl")
+
+
+def legacy_detect_language(text):
+    # partner_bot の旧実装（比較用）
+    if re.search(r'[ぁ-んァ-ン一-龠]', text):
+        return "Japanese"
+    elif re.fullmatch(r'[a-zA-Z]+', text):
+        return "English"
+    else:
+        return "other"
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line)["text"] for line in file if line.strip()]
+
+
+def time_per_call(func, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            func(text)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Language router benchmark")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus)
+    print(f"corpus: {len(texts)} replies ({args.corpus})")
+
+    print("\n[判定結果]")
+    print("legacy  :", dict(Counter(legacy_detect_language(t) for t in texts)))
+    print("classify:", dict(Counter(classify(t) for t in texts)))
+    mixed = sum(1 for t in texts if len({lang for lang, _ in segment(t)}) > 1)
+    print(f"mixed   : {mixed} replies are split across engines")
+
+    print("\n[処理時間 (us/call)]")
+    for name, func in [("legacy", legacy_detect_language), ("classify", classify), ("segment", segment)]:
+        print(f"{name:<9}: {time_per_call(func, texts, args.repeat):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+メッセージ処理パイプラインのリプレイベンチマーク
+
+    python -m bench.bench_pipeline --bot mona --chats 8 --gemini-latency 0.8 --voicevox-latency 0.2
+
+記録済みの会話コーパスを、ボットの echo() にそのまま流して計測します。
+Gemini・Telegram・VOICEVOX はローカルのスタブに差し替えるので、本番のサービスには繋ぎません。
+N 個のチャットがそれぞれ開始位置をずらしてコーパスを順番に送り、チャット同士は並列に動きます。
+
+計測する項目:
+    - 1メッセージの処理時間（echo() が返信を送り終えるまで）の p50 / p95 / p99
+    - メッセージを受け取ってから最初の音声が再生され始めるまでの時間
+    - ファイルの open / rename の回数（sys.addaudithook で数える）
+    - スループット（メッセージ/秒）
+    - 処理段階ごとの平均時間（bot_common.metrics の span）
+"""
+
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from bench.stubs import (FakeGenaiClient, FakeTelegram, RecordingSink, fake_context,
+                         fake_gtts_synthesize, start_fake_voicevox)
+from bot_common.audio_cache import AudioCache
+from bot_common.conversation import ConversationStore
+from bot_common.gemini import GeminiClient
+from bot_common.metrics import STAGE_SECONDS
+from bot_common.prompts import PromptRegistry
+from bot_common.scheduler import TokenBucket
+from bot_common.sessions import SessionManager
+from bot_common.summarizer import RollingSummarizer
+from bot_common.tts import PlaybackQueue, VoicevoxClient, VoicevoxSpeaker
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+DEFAULT_CORPUS = os.path.join(CORPUS_DIR, "conversation.jsonl")
+DEFAULT_REPLIES = os.path.join(CORPUS_DIR, "replies.jsonl")
+
+BOTS = {
+    "mona": os.path.join(ROOT, "Mona", "Mona_Klein_v2.py"),
+    "partner": os.path.join(ROOT, "partner_bot", "parner_bot.py"),
+}
+
+# 処理中のメッセージの記録（チャットごとのタスクの中でだけ見える）
+current_message = contextvars.ContextVar("current_message", default=None)
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line)["text"] for line in file if line.strip()]
+
+
+def load_bot(name):
+    """
+    ボットのスクリプトをモジュールとして読み込む（__main__ の部分は実行されない）
+    """
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", BOTS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class IOCounter:
+    """
+    監査フックでファイルの open / rename を数える（enabled の間だけ）
+    """
+    def __init__(self):
+        self.enabled = False
+        self.counts = {"open": 0, "rename": 0}
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if not self.enabled:
+            return
+        if event == "open":
+            self.counts["open"] += 1
+        elif event == "os.rename":
+            # os.replace もこのイベントになる
+            self.counts["rename"] += 1
+
+
+def track_first_audio(playback):
+    """
+    メッセージごとに最初に再生キューへ積まれた音声を記録する
+    """
+    put = playback.put
+
+    def tracked_put(source, fmt="wav"):
+        record = current_message.get()
+        if record is not None and "first_audio" not in record:
+            record["first_audio"] = source
+        put(source, fmt)
+
+    playback.put = tracked_put
+
+
+def prompt_path(directory, filename):
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        # master_simple.txt などリポジトリに無いものは master.txt で代用する
+        path = os.path.join(directory, "master.txt")
+    return path
+
+
+def setup_mona(bot, genai_client, voice):
+    """
+    Mona_Klein_v2.py の __main__ と同じ構成で依存オブジェクトを組み立てる
+    """
+    bot_dir = os.path.dirname(BOTS["mona"])
+    bot.gemini = GeminiClient(genai_client, max_concurrency=bot.GEMINI_MAX_CONCURRENCY)
+    bot.telegram_limiter = TokenBucket(rate=bot.TELEGRAM_SENDS_PER_MINUTE / 60, capacity=5)
+    bot.store = ConversationStore(max_turns=bot.HISTORY_MAX_TURNS, token_budget=bot.HISTORY_TOKEN_BUDGET)
+    bot.prompts = PromptRegistry({name: prompt_path(bot_dir, filename) for name, filename in bot.PROMPT_FILES.items()})
+    bot.audio_cache = voice.client.cache
+    bot.voice = voice
+    bot.sessions = SessionManager(
+        max_active=bot.MAX_ACTIVE_SESSIONS,
+        store=bot.store,
+        summarizer_factory=lambda chat_id, summary_path: RollingSummarizer(
+            bot.gemini.generate, bot.prompts, summary_path=summary_path,
+            min_turns=bot.SUMMARY_MIN_TURNS, min_chars=bot.SUMMARY_MIN_CHARS, max_pending=bot.HISTORY_MAX_TURNS
+        )
+    )
+    return [asyncio.create_task(bot.store.run_flusher())]
+
+
+def setup_partner(bot, genai_client, voice, gtts_latency=0.0):
+    """
+    parner_bot.py の __main__ と同じ構成で依存オブジェクトを組み立てる（gTTS もスタブにする）
+    """
+    bot.gemini = GeminiClient(genai_client)
+    bot.telegram_limiter = TokenBucket(rate=bot.TELEGRAM_SENDS_PER_MINUTE / 60, capacity=5)
+    bot.audio_cache = voice.client.cache
+    bot.voice = voice
+    bot.sessions = SessionManager()
+    bot.gtts_synthesize = functools.partial(fake_gtts_synthesize, latency=gtts_latency)
+    return []
+
+
+async def teardown(bot, tasks):
+    for task in tasks:
+        task.cancel()
+    store = getattr(bot, "store", None)
+    if store is not None:
+        store.flush()
+    bot.sessions.save_all()
+
+
+async def replay_chat(bot, telegram, chat_id, messages, records):
+    context = fake_context(telegram)
+    for text in messages:
+        record = {"chat_id": chat_id, "start": time.perf_counter()}
+        token = current_message.set(record)
+        try:
+            await bot.echo(telegram.update(chat_id, text), context)
+        finally:
+            current_message.reset(token)
+        record["end"] = time.perf_counter()
+        records.append(record)
+
+
+def time_to_first_audio(records, sink):
+    """
+    メッセージを受け取ってから最初の音声の再生が始まるまでの秒数の一覧
+    """
+    ttfa = []
+    for record in records:
+        source = record.get("first_audio")
+        if source is None:
+            continue
+        audio = source.result() if asyncio.isfuture(source) else source
+        started = sink.first_play(audio, record["start"])
+        if started is not None:
+            ttfa.append(started - record["start"])
+    return ttfa
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ms = np.asarray(values) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(ms.max())}
+
+
+async def run(args):
+    messages = load_corpus(args.corpus)[:args.messages or None]
+    genai_client = FakeGenaiClient(load_corpus(args.replies), args.gemini_latency, args.jitter)
+    telegram = FakeTelegram(args.telegram_latency, args.jitter)
+    runner, voicevox_app, port = await start_fake_voicevox(args.voicevox_latency)
+    sink = RecordingSink(realtime=args.realtime_playback)
+    io_counter = IOCounter()
+
+    voice = VoicevoxSpeaker(VoicevoxClient(host="127.0.0.1", port=port, cache=AudioCache()), PlaybackQueue(sink))
+    track_first_audio(voice.playback)
+
+    records = []
+    # ボットの print はベンチマークの出力に混ぜない
+    output = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        bot = load_bot(args.bot)
+        if args.bot == "mona":
+            tasks = setup_mona(bot, genai_client, voice)
+        else:
+            tasks = setup_partner(bot, genai_client, voice, args.gtts_latency)
+
+        io_counter.enabled = True
+        start = time.perf_counter()
+        # チャットごとにコーパスの開始位置をずらし、全チャットが同じ文を同時に送らないようにする
+        await asyncio.gather(*(
+            replay_chat(bot, telegram, f"bench-{i}", messages[i % len(messages):] + messages[:i % len(messages)], records)
+            for i in range(args.chats)
+        ))
+        wall = time.perf_counter() - start
+        await voice.playback.join()
+        await teardown(bot, tasks)
+        io_counter.enabled = False
+        await voice.close()
+    await runner.cleanup()
+
+    total = len(records)
+    return {
+        "bot": args.bot,
+        "chats": args.chats,
+        "messages": total,
+        "wall_seconds": wall,
+        "throughput": total / wall if wall > 0 else None,
+        "latency_ms": percentiles([r["end"] - r["start"] for r in records]),
+        "time_to_first_audio_ms": percentiles(time_to_first_audio(records, sink)),
+        "file_io": dict(io_counter.counts, per_message=sum(io_counter.counts.values()) / max(total, 1)),
+        "stub_calls": {
+            "gemini": genai_client.stats,
+            "voicevox": dict(voicevox_app["stats"]),
+            "telegram": telegram.stats,
+        },
+        "audio_cache": voice.client.cache.stats(),
+        "stages": STAGE_SECONDS.summary(),
+    }
+
+
+def format_percentiles(stats):
+    if stats["p50"] is None:
+        return "-"
+    return "  ".join(f"{key} {value:8.1f}" for key, value in stats.items())
+
+
+def print_report(result):
+    print(f"bot: {result['bot']}  chats: {result['chats']}  messages: {result['messages']}")
+    print(f"wall       : {result['wall_seconds']:.2f} s")
+    print(f"throughput : {result['throughput']:.2f} msg/s")
+    print("\n[レイテンシ (ms)]")
+    print(f"end-to-end : {format_percentiles(result['latency_ms'])}")
+    print(f"first audio: {format_percentiles(result['time_to_first_audio_ms'])}")
+    print("\n[ファイル I/O]")
+    file_io = result["file_io"]
+    print(f"open {file_io['open']}  rename {file_io['rename']}  ({file_io['per_message']:.2f} / message)")
+    print("\n[処理段階ごとの平均 (ms)]")
+    for stage, stats in sorted(result["stages"].items()):
+        print(f"{stage:<28}: {stats['mean'] * 1000:8.1f}  ({stats['count']} 回)")
+    print("\n[スタブへの呼び出し]")
+    for name, stats in result["stub_calls"].items():
+        print(f"{name:<9}: {stats}")
+    print(f"audio cache: {result['audio_cache']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message pipeline replay benchmark")
+    parser.add_argument("--bot", choices=sorted(BOTS), default="mona")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--replies", default=DEFAULT_REPLIES, help="Gemini のスタブが返す返信のコーパス")
+    parser.add_argument("--chats", type=int, default=4, help="並列に会話するチャット数")
+    parser.add_argument("--messages", type=int, default=0, help="1チャットあたりのメッセージ数（0 ならコーパス全部）")
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--voicevox-latency", type=float, default=0.2)
+    parser.add_argument("--telegram-latency", type=float, default=0.1)
+    parser.add_argument("--gtts-latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2, help="遅延のばらつき（0.2 なら ±20%%）")
+    parser.add_argument("--realtime-playback", action="store_true", help="音声の長さだけ再生を待つ")
+    parser.add_argument("--workdir", help="履歴やキャッシュを書き出すディレクトリ（省略時は一時ディレクトリ）")
+    parser.add_argument("--output", help="結果を JSON で保存するパス（変更前後の比較用）")
+    parser.add_argument("--verbose", action="store_true", help="ボットの print を表示する")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    # ボットは履歴・セッション・音声キャッシュをカレントディレクトリに書くので作業用ディレクトリに移る
+    args.corpus, args.replies = os.path.abspath(args.corpus), os.path.abspath(args.replies)
+    os.chdir(workdir)
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
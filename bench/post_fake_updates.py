@@ -0,0 +1,99 @@
+"""
+Webhook サーバーに偽の Telegram の更新を投げる動作確認用スクリプト
+
+    python -m bench.post_fake_updates --url http://127.0.0.1:5000/telegram --chats 8 --messages 5
+
+Telegram の Update と同じ形の JSON を、チャットごとに順番に、チャット同士は並列に POST します。
+応答のステータスと受け付けまでの時間を集計し、最後に /healthz の処理待ち件数を表示します。
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bot_common.webhook import SECRET_HEADER
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "conversation.jsonl")
+
+_update_ids = itertools.count(1)
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line)["text"] for line in file if line.strip()]
+
+
+def fake_update(chat_id, text):
+    """
+    プライベートチャットのテキストメッセージの Update
+    """
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": f"bench{chat_id}"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"bench{chat_id}"},
+            "text": text,
+        },
+    }
+
+
+async def post_chat(session, url, headers, chat_id, texts, results):
+    for text in texts:
+        start = time.perf_counter()
+        async with session.post(url, json=fake_update(chat_id, text), headers=headers) as response:
+            await response.read()
+            results.append((response.status, time.perf_counter() - start))
+
+
+async def run(args):
+    texts = load_corpus(args.corpus)[:args.messages or None]
+    headers = {SECRET_HEADER: args.secret} if args.secret else {}
+    results = []
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            post_chat(session, args.url, headers, 100000 + i, texts, results) for i in range(args.chats)
+        ))
+        wall = time.perf_counter() - start
+
+        parts = urlsplit(args.url)
+        health_url = urlunsplit((parts.scheme, parts.netloc, "/healthz", "", ""))
+        try:
+            async with session.get(health_url) as response:
+                health = await response.json()
+        except (aiohttp.ClientError, ValueError):
+            health = None
+
+    latencies = np.asarray([seconds for _, seconds in results]) * 1000
+    print(f"posted: {len(results)} updates from {args.chats} chats in {wall:.2f} s")
+    print("status:", dict(Counter(status for status, _ in results)))
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"accept latency (ms): p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}")
+    print("healthz:", health)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post fake Telegram updates to a webhook server")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/telegram")
+    parser.add_argument("--secret", default=os.getenv("MONA_WEBHOOK_SECRET"))
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--chats", type=int, default=8)
+    parser.add_argument("--messages", type=int, default=5, help="1チャットあたりのメッセージ数（0 ならコーパス全部）")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+ベンチマーク用の外部サービスのスタブ（Gemini / Telegram / VOICEVOX / 音声出力）
+
+どれも遅延を指定でき、呼び出し回数を数えます。
+"""
+
+import asyncio
+import hashlib
+import io
+import random
+import time
+import wave
+
+from aiohttp import web
+
+from bot_common.fake_voicevox import create_app, silent_wav
+from bot_common.tts import AudioSink
+
+
+def _delay(latency, jitter):
+    if jitter:
+        latency *= random.uniform(1 - jitter, 1 + jitter)
+    return max(0.0, latency)
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class _CachedContent:
+    def __init__(self, name):
+        self.name = name
+
+
+class _FakeModels:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def generate_content(self, model, contents, config=None):
+        owner = self.owner
+        owner.stats["generate_content"] += 1
+        await asyncio.sleep(_delay(owner.latency, owner.jitter))
+        return _Response(owner.respond(contents))
+
+
+class _FakeCaches:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def create(self, model, config=None):
+        self.owner.stats["caches.create"] += 1
+        await asyncio.sleep(_delay(self.owner.latency, self.owner.jitter))
+        return _CachedContent(f"cachedContents/fake-{self.owner.stats['caches.create']}")
+
+    async def delete(self, name):
+        self.owner.stats["caches.delete"] += 1
+
+
+class _FakeAio:
+    def __init__(self, owner):
+        self.models = _FakeModels(owner)
+        self.caches = _FakeCaches(owner)
+
+
+class FakeGenaiClient:
+    """
+    genai.Client の代わり（GeminiClient が使う aio.models / aio.caches だけを持つ）
+
+    感情スコア・要約・返信をプロンプトの内容から見分けて返します。
+    返信はコーパスからプロンプトのハッシュで選ぶので、同じ入力には同じ返信が返ります。
+    """
+    def __init__(self, replies, latency=0.0, jitter=0.0):
+        """
+        Args:
+            replies (list): 返信に使うテキストの一覧
+            latency (float): 1リクエストあたりの遅延（秒）
+            jitter (float): 遅延のばらつき（0.2 なら ±20%）
+        """
+        self.replies = replies
+        self.latency = latency
+        self.jitter = jitter
+        self.stats = {"generate_content": 0, "caches.create": 0, "caches.delete": 0}
+        self.aio = _FakeAio(self)
+
+    def respond(self, contents):
+        if "emotion score" in contents:
+            return f"emotion score: {random.randint(3, 7)}"
+        if "[新しい会話]" in contents:
+            return "これまでの会話の要約（ベンチマーク用）"
+        digest = hashlib.sha1(contents.encode("utf-8")).digest()
+        return self.replies[int.from_bytes(digest[:4], "big") % len(self.replies)]
+
+
+class FakeTelegram:
+    """
+    Telegram の Update / Bot の代わりを作る（送信に遅延を入れて回数を数える）
+    """
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.stats = {"reply_text": 0, "send_message": 0}
+        self.bot = _FakeBot(self)
+
+    def update(self, chat_id, text):
+        return _FakeUpdate(self, chat_id, text)
+
+    async def _send(self, kind):
+        self.stats[kind] += 1
+        await asyncio.sleep(_delay(self.latency, self.jitter))
+
+
+class _FakeBot:
+    def __init__(self, telegram):
+        self.telegram = telegram
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.telegram._send("send_message")
+
+
+class _FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+class _FakeMessage:
+    def __init__(self, telegram, text):
+        self.telegram = telegram
+        self.text = text
+
+    async def reply_text(self, text, **kwargs):
+        await self.telegram._send("reply_text")
+
+
+class _FakeUpdate:
+    def __init__(self, telegram, chat_id, text):
+        self.message = _FakeMessage(telegram, text)
+        self.effective_chat = _FakeChat(chat_id)
+
+
+class _FakeContext:
+    def __init__(self, bot):
+        self.bot = bot
+
+
+def fake_context(telegram):
+    """
+    ハンドラに渡す ContextTypes.DEFAULT_TYPE の代わり
+    """
+    return _FakeContext(telegram.bot)
+
+
+class RecordingSink(AudioSink):
+    """
+    再生を開始した時刻を記録する音声出力
+
+    realtime=True なら WAV の長さだけ実際に待ち、スピーカーが1つしかない状況を再現します。
+    """
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.plays = []  # (id(audio), 再生開始時刻)
+
+    def play(self, audio, fmt):
+        self.plays.append((id(audio), time.perf_counter()))
+        if self.realtime and fmt == "wav":
+            with wave.open(io.BytesIO(audio), "rb") as wav:
+                time.sleep(wav.getnframes() / wav.getframerate())
+
+    def first_play(self, audio, since):
+        """
+        audio の再生が since 以降に始まった最初の時刻（再生されていなければ None）
+        """
+        times = [t for key, t in self.plays if key == id(audio) and t >= since]
+        return min(times) if times else None
+
+
+async def start_fake_voicevox(latency=0.0, host="127.0.0.1"):
+    """
+    空いているポートで VOICEVOX のスタブを起動する
+
+    Returns:
+        tuple: (AppRunner, app, port)
+    """
+    app = create_app(latency)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, app, port
+
+
+async def fake_gtts_synthesize(text, lang="en", tld="com", slow=False, cache=None, latency=0.0):
+    """
+    gtts_synthesize の代わり（MP3 の代わりに無音の WAV を返す）
+    """
+    await asyncio.sleep(latency)
+    return silent_wav(0.05 * len(text) + 0.1)
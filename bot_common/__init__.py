@@ -0,0 +1,3 @@
+"""
+Mona / partner_bot 共通モジュール
+"""
@@ -0,0 +1,183 @@
+"""
+合成音声のキャッシュ
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from bot_common.metrics import span
+
+
+def cache_key(text, speaker=None, speedScale=None, pitchScale=None, intonationScale=None, engine="voicevox"):
+    """
+    合成パラメータからキャッシュのキーを作る
+    """
+    payload = json.dumps([engine, text, speaker, speedScale, pitchScale, intonationScale], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    合成済み音声のLRUキャッシュ（メモリ + ディスク）
+
+    メモリとディスクそれぞれ合計サイズの上限を超えたら古いものから削除します。
+    """
+    def __init__(self, directory="audio_cache", max_memory_bytes=32 * 1024 * 1024,
+                 max_disk_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            directory (str): ディスクキャッシュの保存先
+            max_memory_bytes (int): メモリに保持する音声の合計サイズ上限
+            max_disk_bytes (int): ディスクに保存する音声の合計サイズ上限
+        """
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()    # key -> size（古い順）
+        self._disk_bytes = 0
+        self._writing = set()         # ディスクに書き込み中のキー
+        self._creating = {}           # key -> 合成中の Task
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for filename in os.listdir(directory):
+            if filename.endswith(".audio"):
+                stat = os.stat(os.path.join(directory, filename))
+                entries.append((stat.st_mtime, filename[:-len(".audio")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _remember(self, key, audio):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        try:
+            with span("audio_cache.read"), open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    # スレッドで実行するのはファイル操作だけ（_disk / _disk_bytes はイベントループ側でだけ触る）
+    def _write_file(self, key, audio):
+        tmp_path = self._path(key) + ".tmp"
+        with span("audio_cache.write"):
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(key))
+
+    def _remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    async def get(self, key):
+        """
+        キャッシュから音声を取り出す（無ければ None）
+        """
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return audio
+
+        if key in self._disk:
+            audio = await asyncio.to_thread(self._read_disk, key)
+            # 読み込み中に追い出されていることがあるので、もう一度確認してから管理情報を更新する
+            if audio is not None:
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self._remember(key, audio)
+                self.hits += 1
+                return audio
+            # ファイルが消えていたら管理情報からも外す
+            self._disk_bytes -= self._disk.pop(key, 0)
+
+        self.misses += 1
+        return None
+
+    async def put(self, key, audio):
+        """
+        音声をキャッシュに保存する
+        """
+        self._remember(key, audio)
+        if key in self._disk or key in self._writing:
+            return
+        self._writing.add(key)
+        try:
+            await asyncio.to_thread(self._write_file, key, audio)
+        finally:
+            self._writing.discard(key)
+
+        evicted = []
+        self._disk[key] = len(audio)
+        self._disk_bytes += len(audio)
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(old_key)
+        if evicted:
+            await asyncio.to_thread(self._remove_files, evicted)
+
+    async def get_or_create(self, key, create):
+        """
+        キャッシュにあればそれを返し、無ければ create() で合成して保存する
+
+        同じキーの合成が進行中なら、新しく合成せずにその結果を待ちます。
+
+        Args:
+            key (str): cache_key() で作ったキー
+            create: 音声のバイト列を返す async 関数（失敗時は None）
+        """
+        task = self._creating.get(key)
+        if task is None:
+            audio = await self.get(key)
+            if audio is not None:
+                return audio
+            # get() で待っている間に他の呼び出しが合成を始めていたらそれを待つ
+            task = self._creating.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._create(key, create))
+                self._creating[key] = task
+                task.add_done_callback(lambda _: self._creating.pop(key, None))
+        # 待っている側がキャンセルされても、合成は他の呼び出しのために続ける
+        return await asyncio.shield(task)
+
+    async def _create(self, key, create):
+        audio = await create()
+        if audio:
+            await self.put(key, audio)
+        return audio
+
+    def stats(self):
+        """
+        ヒット数・ミス数・使用量を返す
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
@@ -0,0 +1,191 @@
+"""
+チャットごとの会話履歴ストア
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from bot_common.metrics import span
+
+# 旧形式の chat_history.txt の発言ヘッダ
+LEGACY_TURN_PATTERN = re.compile(r"^\[(.+?)の発言\]:", re.MULTILINE)
+
+
+def estimate_tokens(text):
+    """
+    トークン数の概算
+    日本語は1文字≒1トークン、ASCIIは4文字≒1トークンとして数える
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+class ConversationStore:
+    """
+    会話履歴をチャットIDごとのdequeでメモリに保持するストア
+
+    ディスクへはチャットごとの追記型JSONLに定期的にまとめて書き出し(write-behind)、
+    行数が増えすぎたらメモリ上の履歴で書き直して圧縮します。
+    履歴は最初にアクセスした時に読み込み、unload() でメモリから外せます。
+    """
+    def __init__(self, directory="history", max_turns=50, token_budget=1200,
+                 flush_interval=5.0, compact_factor=2):
+        """
+        Args:
+            directory (str): JSONLの保存先ディレクトリ
+            max_turns (int): チャットごとに保持する最大ターン数
+            token_budget (int): プロンプトに入れる履歴のトークン数上限
+            flush_interval (float): ディスクへ書き出す間隔（秒）
+            compact_factor (int): ファイルの行数が max_turns の何倍を超えたら圧縮するか
+        """
+        self.directory = directory
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.flush_interval = flush_interval
+        self.compact_factor = compact_factor
+
+        self._histories = {}   # chat_id -> deque[turn]
+        self._pending = {}     # chat_id -> まだ書き出していないターン
+        self._line_counts = {} # chat_id -> ディスク上の行数
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chat_id):
+        return os.path.join(self.directory, f"{chat_id}.jsonl")
+
+    def _load_chat(self, chat_id):
+        turns = deque(maxlen=self.max_turns)
+        line_count = 0
+        path = self._path(chat_id)
+        if os.path.exists(path):
+            with span("history.load"), open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        turns.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # 書き込み途中で落ちた行は読み飛ばす
+                        continue
+                    line_count += 1
+        self._histories[chat_id] = turns
+        self._line_counts[chat_id] = line_count
+        return turns
+
+    def import_legacy(self, chat_id, path):
+        """
+        旧形式の chat_history.txt を取り込む（履歴が空の場合のみ）
+        """
+        chat_id = str(chat_id)
+        if self.history(chat_id) or not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as file:
+            raw_text = file.read()
+        headers = list(LEGACY_TURN_PATTERN.finditer(raw_text))
+        for header, next_header in zip(headers, headers[1:] + [None]):
+            end = next_header.start() if next_header else len(raw_text)
+            self.append(chat_id, header.group(1), raw_text[header.end():end].strip())
+
+    def history(self, chat_id):
+        """
+        チャットの履歴(deque)を返す
+        """
+        chat_id = str(chat_id)
+        turns = self._histories.get(chat_id)
+        if turns is None:
+            turns = self._load_chat(chat_id)
+        return turns
+
+    def unload(self, chat_id):
+        """
+        未書き出しのターンを書き出してからチャットの履歴をメモリから外す
+        """
+        chat_id = str(chat_id)
+        with self._flush_lock:
+            with self._lock:
+                turns = self._pending.pop(chat_id, None)
+            if turns:
+                self._append_lines(chat_id, turns)
+            with self._lock:
+                self._histories.pop(chat_id, None)
+                self._line_counts.pop(chat_id, None)
+
+    def append(self, chat_id, speaker, text):
+        """
+        ターンを追加（ディスクへの書き出しは flush でまとめて行う）
+        """
+        chat_id = str(chat_id)
+        turn = {"speaker": speaker, "text": text, "time": time.time()}
+        with self._lock:
+            self.history(chat_id).append(turn)
+            self._pending.setdefault(chat_id, []).append(turn)
+        return turn
+
+    def render(self, chat_id, token_budget=None):
+        """
+        トークン予算に収まる範囲で新しい方からターン単位で履歴を切り出し、プロンプト用の文字列にする
+        """
+        if token_budget is None:
+            token_budget = self.token_budget
+        lines = []
+        used = 0
+        for turn in reversed(self.history(chat_id)):
+            line = f"[{turn['speaker']}の発言]:{turn['text']}\n"
+            cost = estimate_tokens(line)
+            if lines and used + cost > token_budget:
+                break
+            lines.append(line)
+            used += cost
+        return "".join(reversed(lines))
+
+    def flush(self):
+        """
+        溜まったターンをJSONLに追記し、必要ならファイルを圧縮する
+        """
+        with self._flush_lock, span("history.flush"):
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+
+        for chat_id, turns in pending.items():
+            self._append_lines(chat_id, turns)
+            if chat_id in self._histories and self._line_counts[chat_id] > self.max_turns * self.compact_factor:
+                self._compact(chat_id)
+
+    def _append_lines(self, chat_id, turns):
+        with open(self._path(chat_id), "a", encoding="utf-8") as f:
+            for turn in turns:
+                f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+        self._line_counts[chat_id] = self._line_counts.get(chat_id, 0) + len(turns)
+
+    def _compact(self, chat_id):
+        with self._lock:
+            turns = list(self.history(chat_id))
+            # スナップショットに含まれるので二重に追記しない
+            self._pending.pop(chat_id, None)
+        path = self._path(chat_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for turn in turns:
+                f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        self._line_counts[chat_id] = len(turns)
+
+    async def run_flusher(self):
+        """
+        一定間隔でディスクへ書き出すバックグラウンドループ
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
@@ -0,0 +1,101 @@
+"""
+書きかけのメッセージを送らないための安定待ち（デバウンス）と、同じ内容の重複除去
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+
+def is_continuation(old, new, ratio=0.5):
+    """
+    new が old の続き（ストリーミングで伸びている途中）とみなせるか
+    """
+    common = len(os.path.commonprefix([old, new]))
+    return common >= min(len(old), len(new)) * ratio
+
+
+class Debouncer:
+    """
+    送信元ごとに、内容が settle 秒変わらなくなってから emit() を呼ぶ
+
+    ストリーミング中の返答は続きが届くたびに待ち直し、最後の安定した内容だけを送ります。
+    続きではない別の内容が届いた場合は、待っていた方をすぐに送ってから新しい方を待ちます。
+    offer() に渡した token（永続化した行のキーなど）は、まとめられた分も含めて emit() に渡します。
+    """
+    def __init__(self, emit, settle=4.0):
+        """
+        Args:
+            emit: (text, timestamp, tokens) を受け取る async 関数
+            settle (float): 内容が変わらなくなってから送るまでの秒数
+        """
+        self.emit = emit
+        self.settle = settle
+        self._pending = {}  # source -> [text, timestamp, TimerHandle, tokens]
+        self._tasks = set()
+
+    def offer(self, source, text, timestamp=None, token=None):
+        entry = self._pending.get(source)
+        tokens = [] if token is None else [token]
+        if entry is not None:
+            if text == entry[0]:
+                # 同じ内容の再送は待ち時間を延ばさない
+                entry[3].extend(tokens)
+                return
+            if is_continuation(entry[0], text):
+                entry[2].cancel()
+                tokens = entry[3] + tokens
+            else:
+                self._fire(source)
+        handle = asyncio.get_running_loop().call_later(self.settle, self._fire, source)
+        self._pending[source] = [text, timestamp, handle, tokens]
+
+    def _fire(self, source):
+        entry = self._pending.pop(source, None)
+        if entry is None:
+            return
+        entry[2].cancel()
+        task = asyncio.ensure_future(self.emit(entry[0], entry[1], entry[3]))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print("Error in debounced emit:", task.exception())
+
+    def pending(self):
+        return len(self._pending)
+
+    async def flush(self):
+        """
+        待っている内容をすべてすぐに送り、送り終えるまで待つ（終了時用）
+        """
+        for source in list(self._pending):
+            self._fire(source)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class RecentContent:
+    """
+    最近送った内容のハッシュを ttl 秒だけ覚えておく重複除去
+    """
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._expires = OrderedDict()  # ハッシュ -> 期限（登録順 = 期限順）
+
+    def seen(self, text):
+        """
+        ttl 秒以内に同じ内容を見ていれば True（見ていなければ覚えて False）
+        """
+        now = time.monotonic()
+        while self._expires and next(iter(self._expires.values())) <= now:
+            self._expires.popitem(last=False)
+
+        key = hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+        if key in self._expires:
+            return True
+        self._expires[key] = now + self.ttl
+        return False
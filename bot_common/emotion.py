@@ -0,0 +1,168 @@
+"""
+感情スコアの時系列とローカルの簡易スコアラー
+"""
+
+import re
+
+import numpy as np
+
+# Gemini の返答から取り出すスコア（"emotion score: 6" の形式）
+SCORE_PATTERN = re.compile(r"emotion\s*score\s*[:：]\s*(\d+(?:\.\d+)?)", re.IGNORECASE)
+MIN_SCORE = 1
+MAX_SCORE = 10
+NEUTRAL_SCORE = 5
+
+# 気分が「下がり気味」「上がり気味」とみなす1メッセージあたりの傾き
+FALLING_SLOPE = -0.15
+RISING_SLOPE = 0.15
+
+# ローカルの辞書でわかる感情語（形容詞は活用しても当たるように語幹で持つ）
+POSITIVE_WORDS = (
+    "嬉し", "うれし", "楽し", "たのし", "好き", "すき", "ありがと", "最高", "幸せ",
+    "しあわせ", "よかった", "良かった", "素敵", "面白", "おもしろ", "美味し", "おいし",
+    "可愛", "かわい", "ワクワク", "わくわく", "大丈夫", "笑", "♪", "❤", "😊", "😄",
+)
+NEGATIVE_WORDS = (
+    "悲し", "かなし", "寂し", "さみし", "さびし", "辛い", "辛かった", "つら", "疲れ", "つかれ",
+    "嫌い", "きらい", "嫌だ", "いやだ", "最悪", "ムカつ", "むかつ", "腹立", "泣", "しんど",
+    "不安", "痛い", "いたい", "怖", "落ち込", "ごめん", "無理", "😢", "😭",
+)
+# 感情語の直後の否定（「好きじゃない」「楽しくない」など）
+NEGATION_PATTERN = re.compile(r"(?:じゃ|では|く)(?:ない|なかった|ねえ|ねー)")
+LEXICON_PATTERN = re.compile(
+    "|".join(map(re.escape, sorted(POSITIVE_WORDS + NEGATIVE_WORDS, key=len, reverse=True)))
+)
+_POSITIVE = frozenset(POSITIVE_WORDS)
+
+
+def parse_score(text):
+    """
+    Gemini の返答から感情スコアを取り出す（見つからなければ None）
+    """
+    match = SCORE_PATTERN.search(text or "")
+    if match is None:
+        return None
+    return float(min(MAX_SCORE, max(MIN_SCORE, float(match.group(1)))))
+
+
+def lexicon_score(text):
+    """
+    感情語の辞書で大まかなスコアを付ける
+
+    Returns:
+        tuple: (スコア, 確信できるか)
+            感情語が無い時やポジティブとネガティブが混ざっている時は確信できない
+    """
+    positive = negative = 0
+    for match in LEXICON_PATTERN.finditer(text):
+        is_positive = match.group() in _POSITIVE
+        if NEGATION_PATTERN.match(text, match.end()):
+            is_positive = not is_positive
+        if is_positive:
+            positive += 1
+        else:
+            negative += 1
+
+    net = positive - negative
+    # Gemini の採点（8以上は滅多に付けない）に合わせて極端なスコアは付けない
+    score = float(min(NEUTRAL_SCORE + 2, max(MIN_SCORE + 1, NEUTRAL_SCORE + 1.5 * net)))
+    confident = positive + negative > 0 and min(positive, negative) == 0
+    return score, confident
+
+
+class EmotionSeries:
+    """
+    感情スコアの固定長リングバッファ（NumPy 配列で保持して傾向をまとめて計算する）
+    """
+    def __init__(self, capacity=100, scores=()):
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=np.float32)
+        self._start = 0
+        self._size = 0
+        for score in list(scores)[-capacity:]:
+            self.append(score)
+
+    def __len__(self):
+        return self._size
+
+    def append(self, score):
+        end = (self._start + self._size) % self.capacity
+        self._buffer[end] = score
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+
+    def values(self):
+        """
+        古い順に並べたスコアの配列
+        """
+        return np.roll(self._buffer, -self._start)[:self._size]
+
+    def to_list(self):
+        return [float(v) for v in self.values()]
+
+    def rolling_mean(self, window=5):
+        """
+        直近 window 件ごとの移動平均（件数が足りない間は NaN）
+        """
+        values = self.values().astype(np.float64)
+        means = np.full(len(values), np.nan)
+        if len(values) >= window:
+            cumsum = np.cumsum(np.insert(values, 0, 0.0))
+            means[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+        return means
+
+    def ewma(self, alpha=0.3):
+        """
+        指数移動平均の最新値（スコアが無ければ NEUTRAL_SCORE）
+        """
+        values = self.values().astype(np.float64)
+        if len(values) == 0:
+            return float(NEUTRAL_SCORE)
+        # 古いスコアほど (1 - alpha) 倍ずつ軽くして重み付き平均を取る
+        weights = (1 - alpha) ** np.arange(len(values) - 1, -1, -1)
+        weights[1:] *= alpha
+        return float(np.dot(weights, values) / weights.sum())
+
+    def slope(self, window=10):
+        """
+        直近 window 件の最小二乗の傾き（1メッセージあたりのスコアの変化）
+        """
+        values = self.values()[-window:].astype(np.float64)
+        if len(values) < 2:
+            return 0.0
+        x = np.arange(len(values), dtype=np.float64)
+        x -= x.mean()
+        return float(np.dot(x, values - values.mean()) / np.dot(x, x))
+
+    def trend(self, window=10, alpha=0.3):
+        """
+        プロンプトやスケジューラに渡す傾向のまとめ
+        """
+        slope = self.slope(window)
+        if len(self) < 3:
+            direction = "unknown"
+        elif slope <= FALLING_SLOPE:
+            direction = "falling"
+        elif slope >= RISING_SLOPE:
+            direction = "rising"
+        else:
+            direction = "steady"
+        return {
+            "count": len(self),
+            "mean": float(self.values()[-window:].mean()) if len(self) else float(NEUTRAL_SCORE),
+            "ewma": self.ewma(alpha),
+            "slope": slope,
+            "direction": direction,
+        }
+
+
+def describe_trend(trend):
+    """
+    傾向をプロンプトに入れる1行にする（まだ傾向がわからなければ空文字）
+    """
+    if trend["direction"] == "unknown":
+        return ""
+    direction = {"falling": "下がり気味", "rising": "上がり気味", "steady": "安定している"}[trend["direction"]]
+    return f'- 恋人の最近の気分は10段階で{trend["ewma"]:.1f}くらいで、{direction}\n'
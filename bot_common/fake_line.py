@@ -0,0 +1,84 @@
+"""
+動作確認用の LINE Messaging API のスタブサーバー
+
+    python -m bot_common.fake_line --port 5001 --latency 0.1 --throttle-every 4
+
+LINE_API_BASE_URL=http://localhost:5001 を設定すると mona_line.py の送信先がこのスタブになります。
+"""
+
+import argparse
+import asyncio
+
+from aiohttp import web
+
+from bot_common.line_push import MAX_MESSAGES_PER_PUSH
+
+
+def create_app(latency=0.0, throttle_every=0, retry_after=1):
+    """
+    /v2/bot/message/push を持つスタブアプリを作る
+
+    Args:
+        latency (float): 各リクエストに加える遅延（秒）
+        throttle_every (int): この回数に1回 429 を返す（0 なら返さない）
+        retry_after (int): 429 の Retry-After（秒）
+    """
+    app = web.Application()
+    app["stats"] = {"requests": 0, "throttled": 0, "pushes": 0, "messages": 0}
+    app["messages"] = []
+    accepted = {}  # X-Line-Retry-Key -> リクエストID
+
+    async def push(request):
+        stats = app["stats"]
+        stats["requests"] += 1
+        await asyncio.sleep(latency)
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return web.json_response({"message": "Authentication failed"}, status=401)
+        if throttle_every and stats["requests"] % throttle_every == 0:
+            stats["throttled"] += 1
+            return web.json_response(
+                {"message": "The API rate limit has been exceeded."},
+                status=429, headers={"Retry-After": str(retry_after)}
+            )
+
+        retry_key = request.headers.get("X-Line-Retry-Key")
+        if retry_key in accepted:
+            return web.json_response(
+                {"message": "The retry key is already accepted"},
+                status=409, headers={"x-line-accepted-request-id": accepted[retry_key]}
+            )
+
+        body = await request.json()
+        messages = body.get("messages", [])
+        if not body.get("to") or not 1 <= len(messages) <= MAX_MESSAGES_PER_PUSH:
+            return web.json_response({"message": "The request body has 1 error(s)"}, status=400)
+        # 本文が空・長すぎるテキストは 400（1件でもあればプッシュ全体が失敗する）
+        for message in messages:
+            if message.get("type") == "text" and not 0 < len(message.get("text", "")) <= 5000:
+                return web.json_response({"message": "The request body has 1 error(s)"}, status=400)
+
+        request_id = f"fake-{stats['requests']}"
+        if retry_key:
+            accepted[retry_key] = request_id
+        stats["pushes"] += 1
+        stats["messages"] += len(messages)
+        app["messages"].extend(messages)
+        return web.json_response({"sentMessages": [{"id": str(i)} for i in range(len(messages))]},
+                                 headers={"x-line-request-id": request_id})
+
+    async def stats(request):
+        return web.json_response(app["stats"])
+
+    app.router.add_post("/v2/bot/message/push", push)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake LINE Messaging API")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency, args.throttle_every), host=args.host, port=args.port)
@@ -0,0 +1,67 @@
+"""
+動作確認用の VOICEVOX エンジンのスタブサーバー
+
+    python -m bot_common.fake_voicevox --port 50021 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import io
+import wave
+
+from aiohttp import web
+
+
+def silent_wav(seconds=0.2, rate=24000):
+    """
+    無音のWAVを生成する
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def create_app(latency=0.0):
+    """
+    /audio_query, /synthesis, /speakers を持つスタブアプリを作る
+
+    Args:
+        latency (float): 各リクエストに加える遅延（秒）
+    """
+    app = web.Application()
+    app["stats"] = {"audio_query": 0, "synthesis": 0}
+
+    async def audio_query(request):
+        app["stats"]["audio_query"] += 1
+        await asyncio.sleep(latency)
+        text = request.query.get("text", "")
+        return web.json_response({"accent_phrases": [], "kana": text, "speedScale": 1.0})
+
+    async def synthesis(request):
+        app["stats"]["synthesis"] += 1
+        query = await request.json()
+        await asyncio.sleep(latency)
+        # 文字数に比例した長さの無音を返す
+        seconds = 0.05 * len(query.get("kana", "")) + 0.1
+        return web.Response(body=silent_wav(seconds), content_type="audio/wav")
+
+    async def speakers(request):
+        return web.json_response([{"name": "Fake", "styles": [{"name": "ノーマル", "id": 0}]}])
+
+    app.router.add_post("/audio_query", audio_query)
+    app.router.add_post("/synthesis", synthesis)
+    app.router.add_get("/speakers", speakers)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake VOICEVOX engine")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=50021)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency), host=args.host, port=args.port)
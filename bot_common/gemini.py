@@ -0,0 +1,147 @@
+"""
+Gemini API 呼び出しの共通ラッパー
+"""
+
+import asyncio
+import hashlib
+import time
+
+from google.genai import types
+
+from bot_common.metrics import span
+
+
+def request_key(*parts):
+    """
+    リクエスト内容からキーを作る
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class GeminiClient:
+    """
+    google-genai の非同期クライアントで generate_content を呼び出す
+
+    - 同時に投げるリクエスト数はセマフォで制限します。
+    - 内容が同じリクエストが実行中なら、新しく投げずにその結果を待ちます。
+    - cache_ttl を指定した呼び出し（感情スコアなど）は結果を一定時間キャッシュします。
+    - prefix に渡した大きな固定プロンプトは Gemini のコンテキストキャッシュに載せ、毎回送らないようにします。
+    - rate_limiter (TokenBucket) を渡すと、実際に送るリクエストの頻度を制限します。
+    """
+    def __init__(self, client, model="gemini-2.5-flash", max_concurrency=4, context_cache_ttl=3600,
+                 rate_limiter=None):
+        """
+        Args:
+            client: genai.Client
+            model (str): 使用するモデル名
+            max_concurrency (int): 同時に実行するリクエストの上限
+            context_cache_ttl (int): コンテキストキャッシュの有効期間（秒）
+            rate_limiter (TokenBucket): リクエスト頻度の制限（None なら制限しない）
+        """
+        self.client = client
+        self.model = model
+        self.context_cache_ttl = context_cache_ttl
+        self.rate_limiter = rate_limiter
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}         # key -> 実行中の Task
+        self._results = {}          # key -> (期限, 応答テキスト)
+        self._context_caches = {}   # prefixのキー -> (期限, キャッシュ名) / 作成できなかった場合は (期限, None)
+        self._context_lock = asyncio.Lock()
+
+    async def generate(self, contents, prefix=None, cache_ttl=None):
+        """
+        プロンプトを投げて応答テキストを返す
+
+        Args:
+            contents (str): プロンプト（prefix を指定した場合はその後ろに続く部分）
+            prefix (str): 毎回同じ先頭部分（マスタープロンプトなど）
+            cache_ttl (float): 結果をキャッシュする秒数（None ならキャッシュしない）
+        """
+        key = request_key(self.model, prefix, contents)
+
+        if cache_ttl is not None:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._generate(contents, prefix))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # 同じリクエストを待っている他の呼び出しがキャンセルされても巻き込まれないように shield する
+        text = await asyncio.shield(task)
+        if cache_ttl is not None:
+            self._results[key] = (time.monotonic() + cache_ttl, text)
+            self._prune_results()
+        return text
+
+    async def _generate(self, contents, prefix):
+        cache_name = await self._context_cache(prefix) if prefix else None
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        async with self._semaphore:
+            with span("gemini"):
+                if cache_name is not None:
+                    response = await self.client.aio.models.generate_content(
+                        model=self.model,
+                        contents=contents,
+                        config=types.GenerateContentConfig(cached_content=cache_name)
+                    )
+                else:
+                    response = await self.client.aio.models.generate_content(
+                        model=self.model,
+                        contents=(prefix or "") + contents
+                    )
+        return response.text
+
+    async def _context_cache(self, prefix):
+        """
+        prefix のコンテキストキャッシュ名を返す（作れない場合は None）
+        """
+        key = request_key(self.model, prefix)
+        async with self._context_lock:
+            now = time.monotonic()
+            entry = self._context_caches.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+            # prefix が編集されたら古いキャッシュは捨てる
+            for old_key, (_, old_name) in list(self._context_caches.items()):
+                if old_key != key and old_name is not None:
+                    await self._delete_context_cache(old_name)
+            self._context_caches.clear()
+
+            try:
+                cache = await self.client.aio.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[types.Content(role="user", parts=[types.Part(text=prefix)])],
+                        ttl=f"{self.context_cache_ttl}s"
+                    )
+                )
+                name = cache.name
+            except Exception as e:
+                # トークン数が最小値に満たない場合などは通常のリクエストで送る
+                print("Context cache is not available:", e)
+                name = None
+
+            # 期限切れ直前のキャッシュを使わないように少し早めに作り直す
+            self._context_caches[key] = (now + self.context_cache_ttl * 0.9, name)
+            return name
+
+    async def _delete_context_cache(self, name):
+        try:
+            await self.client.aio.caches.delete(name=name)
+        except Exception as e:
+            print("Failed to delete context cache:", e)
+
+    def _prune_results(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._results.items() if expires <= now]:
+            del self._results[key]
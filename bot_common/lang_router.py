@@ -0,0 +1,100 @@
+"""
+返信テキストの言語判定と読み上げエンジンの振り分け
+"""
+
+import re
+
+# ひらがな・カタカナ（半角含む）・漢字・々〆ー
+JAPANESE_CLASS = (
+    "\u3040-\u309F\u30A0-\u30FF\u31F0-\u31FF\uFF66-\uFF9F"
+    "\u3400-\u4DBF\u4E00-\u9FFF\uF900-\uFAFF\u3005\u3006"
+)
+# 基本ラテン文字とアクセント付きラテン文字
+LATIN_CLASS = "A-Za-z\u00C0-\u024F"
+
+JAPANESE_RUN = re.compile(f"[{JAPANESE_CLASS}]+")
+LATIN_RUN = re.compile(f"[{LATIN_CLASS}]+")
+# 日本語の連続 / 英単語の連続（単語間の空白や記号を含む） / その他の1文字
+TOKEN_PATTERN = re.compile(
+    f"(?P<ja>[{JAPANESE_CLASS}]+)"
+    f"|(?P<en>[{LATIN_CLASS}]+(?:[\\s'’,.!?;:\\-]+[{LATIN_CLASS}]+)*)"
+    f"|(?P<other>.)",
+    re.DOTALL
+)
+
+# この割合以上が日本語の文字なら日本語とみなす
+JAPANESE_RATIO_THRESHOLD = 0.3
+# 日本語に挟まれた英語がこの単語数未満なら日本語側で読む
+MIN_ENGLISH_WORDS = 3
+
+
+def script_counts(text):
+    """
+    日本語の文字数とラテン文字数を返す
+    """
+    japanese = sum(map(len, JAPANESE_RUN.findall(text)))
+    latin = sum(map(len, LATIN_RUN.findall(text)))
+    return japanese, latin
+
+
+def classify(text):
+    """
+    文字種の割合からテキスト全体の言語を判定する
+
+    Returns:
+        str: "Japanese" / "English" / "other"
+    """
+    japanese, latin = script_counts(text)
+    if japanese + latin == 0:
+        return "other"
+    if japanese / (japanese + latin) >= JAPANESE_RATIO_THRESHOLD:
+        return "Japanese"
+    return "English"
+
+
+def segment(text, min_english_words=MIN_ENGLISH_WORDS):
+    """
+    日本語と英語が混ざったテキストを言語ごとの区間に分ける
+    記号・数字・絵文字などは直前の区間に含める
+
+    Returns:
+        list: (言語, テキスト) のリスト。言語は "Japanese" / "English" / "other"
+    """
+    runs = []     # [言語, テキスト]
+    prefix = ""   # 最初の区間より前にある記号など
+    for match in TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        piece = match.group()
+        if kind == "other":
+            if runs:
+                runs[-1][1] += piece
+            else:
+                prefix += piece
+            continue
+
+        lang = "Japanese" if kind == "ja" else "English"
+        if runs and runs[-1][0] == lang:
+            runs[-1][1] += piece
+        else:
+            runs.append([lang, piece])
+
+    if not runs:
+        return [("other", text)] if text.strip() else []
+    runs[0][1] = prefix + runs[0][1]
+
+    # 日本語が主体の文では、日本語に隣接する短い英語を日本語の区間にまとめる
+    if classify(text) == "Japanese":
+        for i, run in enumerate(runs):
+            if run[0] != "English" or len(LATIN_RUN.findall(run[1])) >= min_english_words:
+                continue
+            neighbors = runs[max(i - 1, 0):i] + runs[i + 1:i + 2]
+            if any(neighbor[0] == "Japanese" for neighbor in neighbors):
+                run[0] = "Japanese"
+
+    merged = []
+    for lang, piece in runs:
+        if merged and merged[-1][0] == lang:
+            merged[-1] = (lang, merged[-1][1] + piece)
+        else:
+            merged.append((lang, piece))
+    return merged
@@ -0,0 +1,114 @@
+"""
+LINE Messaging API のプッシュ送信（接続の使い回しと再送）
+"""
+
+import asyncio
+import uuid
+
+import aiohttp
+
+# 1回のプッシュに入れられるメッセージ数の上限（LINE の仕様）
+MAX_MESSAGES_PER_PUSH = 5
+
+
+class LinePushRejected(Exception):
+    """
+    LINE が 4xx で受け付けなかった（同じ内容を再送しても通らない）
+    """
+    def __init__(self, status, body):
+        super().__init__(f"{status} {body}")
+        self.status = status
+
+
+def text_message(text):
+    return {"type": "text", "text": text}
+
+
+class LinePushSender:
+    """
+    LINE にプッシュ送信する（送るタイミングとまとめ方は呼び出し側の送信箱が決める）
+
+    - HTTPセッションを使い回して api.line.me への接続を keep-alive で保ちます。
+    - 429 や 5xx は Retry-After か指数バックオフで待ってから再送します。
+      再送には同じ X-Line-Retry-Key を付けるので、LINE 側で二重に届くことはありません。
+    """
+    def __init__(self, access_token, to, base_url="https://api.line.me",
+                 max_retries=5, backoff=1.0, max_connections=4):
+        """
+        Args:
+            access_token (str): チャネルアクセストークン
+            to (str): 送信先のユーザーID
+            base_url (str): API のURL（テスト時はスタブのURLにする）
+            max_retries (int): 再送の回数の上限
+            backoff (float): 再送までの待ち時間の初期値（秒、回数ごとに倍にする）
+            max_connections (int): 同時に張る接続数の上限
+        """
+        self.access_token = access_token
+        self.to = to
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self._session = None
+        self.stats = {"sent": 0, "failed": 0, "pushes": 0, "retries": 0}
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Authorization": f"Bearer {self.access_token}"}
+            )
+        return self._session
+
+    async def push(self, messages, retry_key=None):
+        """
+        メッセージを1回のプッシュで送る（再送込みで成功したら True）
+
+        Args:
+            messages (list): メッセージオブジェクトのリスト（5件まで）
+            retry_key (str): X-Line-Retry-Key（UUID 形式、省略時は新しく作る）
+                LINE は同じキーの要求を24時間受け付けないので、別のメッセージには必ず別のキーを使うこと
+
+        Raises:
+            LinePushRejected: 429 以外の 4xx が返ってきた場合
+        """
+        ok = False
+        try:
+            ok = await self._post(messages, retry_key or str(uuid.uuid4()))
+        finally:
+            self.stats["sent" if ok else "failed"] += len(messages)
+        return ok
+
+    async def _post(self, messages, retry_key):
+        url = f"{self.base_url}/v2/bot/message/push"
+        payload = {"to": self.to, "messages": messages}
+        headers = {"X-Line-Retry-Key": retry_key}
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._get_session().post(url, json=payload, headers=headers) as response:
+                    self.stats["pushes"] += 1
+                    if response.status == 200:
+                        return True
+                    # 再送キーが同じ要求が既に受け付けられている（前回の応答が届かなかった）
+                    if response.status == 409 and "x-line-accepted-request-id" in response.headers:
+                        return True
+                    body = await response.text()
+                    if response.status != 429 and response.status < 500:
+                        raise LinePushRejected(response.status, body)
+                    retry_after = response.headers.get("Retry-After")
+            except aiohttp.ClientError as e:
+                body, retry_after = str(e), None
+
+            if attempt == self.max_retries:
+                print(f"Error in LINE push (gave up after {attempt} retries): {body}")
+                return False
+            self.stats["retries"] += 1
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+            await asyncio.sleep(delay)
+        return False
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,188 @@
+"""
+処理段階ごとの所要時間の計測と Prometheus 形式のメトリクス出力
+
+    with span("gemini"):
+        response = await ...
+
+span() の時間はヒストグラム bot_stage_seconds{stage="..."} に記録され、
+message_trace() の中で呼ばれた場合はそのメッセージの内訳にも追加されます。
+メッセージの処理が終わると内訳を JSON 1行でログに出します。
+"""
+
+import bisect
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("bot_common.metrics")
+
+# 処理中のメッセージの内訳（asyncio のタスクやスレッドにも引き継がれる）
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    """
+    ラベルごとの累積ヒストグラム
+    """
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # ラベルの組 -> [各バケットの件数, 合計, 件数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self):
+        """
+        ラベルの組ごとの (件数, 平均秒数)
+        """
+        with self._lock:
+            return {
+                ",".join(f"{k}={v}" for k, v in key): {"count": count, "mean": total / count}
+                for key, (_, total, count) in self._series.items() if count
+            }
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                labels = [f'{k}="{v}"' for k, v in key]
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = ",".join(labels + [f'le="{bound}"'])
+                    lines.append(f"{self.name}_bucket{{{le}}} {cumulative}")
+                le = ",".join(labels + ['le="+Inf"'])
+                lines.append(f"{self.name}_bucket{{{le}}} {count}")
+                suffix = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {total}")
+                lines.append(f"{self.name}_count{suffix} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRegistry:
+    """
+    ヒストグラムをまとめて Prometheus のテキスト形式で出力する
+    """
+    def __init__(self):
+        self._histograms = {}
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        if name not in self._histograms:
+            self._histograms[name] = Histogram(name, help_text, buckets)
+        return self._histograms[name]
+
+    def render(self):
+        return "".join(histogram.render() for histogram in self._histograms.values())
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("bot_stage_seconds", "Time spent in each stage of message handling")
+MESSAGE_SECONDS = REGISTRY.histogram("bot_message_seconds", "End-to-end time to handle one message")
+
+
+@contextlib.contextmanager
+def span(stage):
+    """
+    with ブロックの所要時間を stage として記録する（同期・非同期のどちらの処理にも使える）
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["stages"].append((stage, elapsed))
+
+
+@contextlib.contextmanager
+def message_trace(kind, chat_id):
+    """
+    1メッセージ分の処理を囲み、終わったら段階ごとの内訳を JSON 1行でログに出す
+
+    Args:
+        kind (str): 処理の種類（"echo" / "small_talk" など）
+        chat_id: チャットID
+    """
+    trace = {"stages": []}
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        elapsed = time.perf_counter() - start
+        MESSAGE_SECONDS.observe(elapsed, kind=kind)
+        stages = {}
+        for stage, seconds in trace["stages"]:
+            stages[stage] = round(stages.get(stage, 0.0) + seconds * 1000, 2)
+        logger.info(json.dumps({
+            "event": "message",
+            "kind": kind,
+            "chat_id": str(chat_id),
+            "status": status,
+            "total_ms": round(elapsed * 1000, 2),
+            "stages_ms": stages,
+        }, ensure_ascii=False))
+
+
+def traced(kind, chat_id_of):
+    """
+    async のハンドラ全体を message_trace() で囲むデコレータ
+
+    Args:
+        kind (str): 処理の種類
+        chat_id_of: ハンドラと同じ引数を受け取り chat_id を返す関数
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with message_trace(kind, chat_id_of(*args, **kwargs)):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def start_metrics_server(host="127.0.0.1", port=9101, registry=REGISTRY):
+    """
+    /metrics でメトリクスを返す HTTP サーバーを起動する
+
+    Returns:
+        web.AppRunner: 終了時に cleanup() を呼ぶ
+    """
+    async def metrics(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    # スクレイプのたびにアクセスログが出ないようにする
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Metrics: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,284 @@
+"""
+送信待ちメッセージを SQLite (WAL) に永続化する送信箱
+
+受け付けたメッセージはディスクに書いてから応答し、送信に成功するまで消さないので、
+送信先が落ちていてもプロセスが再起動してもメッセージは失われません（at-least-once）。
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created REAL NOT NULL,
+    next_attempt REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    delivered REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+
+class DeliveryRejected(Exception):
+    """
+    送信先がメッセージを受け付けなかった（再送しても通らない）
+
+    run() に渡す send() がこれを送出すると、まとめて送った分は1件ずつ送り直して、
+    受け付けられなかったものだけを dead にします。
+    """
+
+
+def idempotency_key(text, timestamp=None):
+    """
+    メッセージ本文と送信元のタイムスタンプから冪等キーを作る
+    タイムスタンプが無い場合は重複を判定できないので毎回別のキーにする
+    """
+    if timestamp is None:
+        return uuid.uuid4().hex
+    return hashlib.sha256(f"{timestamp}\n{text}".encode("utf-8")).hexdigest()
+
+
+class Outbox:
+    """
+    SQLite に永続化した送信キュー
+
+    - add() は書き込みをまとめて1つのトランザクションでコミットするので、
+      立て続けに受け付けても fsync はまとめた分につき1回で済みます。
+    - 同じ冪等キーのメッセージは1回しか登録されません。
+    - status='settling' で登録した行は送信されず、settle() で送信待ちの行に置き換えるまで残ります
+      （受け付けたがまだ加工していないメッセージを、落ちても失わないため）。
+    - run() が送信関数を呼び、成功したものだけを送信済みにします。失敗したものはバックオフして再送します。
+    """
+    def __init__(self, path="outbox.sqlite3", commit_interval=0.02, max_attempts=10,
+                 retry_backoff=5.0, keep_delivered=7 * 24 * 3600):
+        """
+        Args:
+            path (str): データベースファイルのパス
+            commit_interval (float): 書き込みをまとめて待つ秒数
+            max_attempts (int): この回数失敗したら諦めて dead にする
+            retry_backoff (float): 再送までの待ち時間の初期値（秒、失敗ごとに倍にする）
+            keep_delivered (float): 送信済みのメッセージ（と冪等キー）を残しておく秒数
+        """
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.keep_delivered = keep_delivered
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL ではコミットごとに1回だけ fsync する
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._pending = []  # (key, payload, Future)
+        self._flusher = None
+        self._wakeup = asyncio.Event()
+        self.commits = 0
+
+    def _execute(self, func):
+        with self._db_lock:
+            return func(self._conn)
+
+    async def add(self, key, payload, status="pending"):
+        """
+        メッセージを登録する（ディスクにコミットされてから戻る）
+
+        Args:
+            status (str): 'pending'（送信待ち）か 'settling'（settle() されるまで送らない）
+
+        Returns:
+            bool: 新しく登録したら True、同じキーが既にあれば False
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((key, json.dumps(payload, ensure_ascii=False), status, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_pending())
+        return await future
+
+    async def _flush_pending(self):
+        # 少し待って、その間に届いた分もまとめて1回でコミットする（コミット中に届いた分は次の回に）
+        while self._pending:
+            await asyncio.sleep(self.commit_interval)
+            batch, self._pending = self._pending, []
+            try:
+                inserted = await asyncio.to_thread(self._execute, lambda conn: self._insert(conn, batch))
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, _, future), ok in zip(batch, inserted):
+                if not future.done():
+                    future.set_result(ok)
+            if any(inserted):
+                self._wakeup.set()
+
+    def _insert(self, conn, batch, delete_keys=()):
+        now = time.time()
+        inserted = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM outbox WHERE key = ? AND status = 'settling'", [(k,) for k in delete_keys])
+            for key, payload, status, _ in batch:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO outbox (key, payload, status, created, next_attempt) VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, status, now, now)
+                )
+                inserted.append(cursor.rowcount == 1)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.commits += 1
+        return inserted
+
+    async def settle(self, keys, items):
+        """
+        'settling' の行を消して、代わりの送信待ちの行を登録する（1つのトランザクションで）
+
+        Args:
+            keys: 消す 'settling' の行のキー
+            items: 登録する (キー, ペイロード) のリスト（空なら消すだけ）
+
+        Returns:
+            list: 登録した行ごとに、新しく登録したら True
+        """
+        rows = [(key, json.dumps(payload, ensure_ascii=False), "pending", None) for key, payload in items]
+        inserted = await asyncio.to_thread(self._execute, lambda conn: self._insert(conn, rows, delete_keys=keys))
+        if any(inserted):
+            self._wakeup.set()
+        return inserted
+
+    def settling(self):
+        """
+        まだ settle() されていない行 [(キー, ペイロード), ...]（起動時の復旧用、古い順）
+        """
+        rows = self._execute(lambda conn: conn.execute(
+            "SELECT key, payload FROM outbox WHERE status = 'settling' ORDER BY id"
+        ).fetchall())
+        return [(key, json.loads(payload)) for key, payload in rows]
+
+    def _claim(self, conn, limit):
+        rows = conn.execute(
+            "SELECT id, key, payload FROM outbox WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+        return [(row_id, key, json.loads(payload)) for row_id, key, payload in rows]
+
+    @staticmethod
+    def batch_key(rows):
+        """
+        まとめて送る行から、送信先での重複除去に使うキーを作る
+
+        同じ行の組を再送する時は同じキーになり、別の行なら本文が同じでも別のキーになります。
+        （データベースを作り直すと行IDは使い回されるので、冪等キーも混ぜる）
+        """
+        name = ";".join(f"{row_id}:{key}" for row_id, key, _ in rows)
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"outbox:{name}"))
+
+    def _mark_delivered(self, conn, ids):
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "UPDATE outbox SET status = 'delivered', delivered = ?, attempts = attempts + 1 WHERE id = ?",
+            [(time.time(), row_id) for row_id in ids]
+        )
+        conn.execute("COMMIT")
+
+    def _mark_failed(self, conn, ids, error, permanent=False):
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        for row_id in ids:
+            attempts = conn.execute("SELECT attempts FROM outbox WHERE id = ?", (row_id,)).fetchone()[0] + 1
+            status = "dead" if permanent or attempts >= self.max_attempts else "pending"
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (status, attempts, now + self.retry_backoff * 2 ** (attempts - 1), error, row_id)
+            )
+        conn.execute("COMMIT")
+
+    def _prune(self, conn):
+        conn.execute(
+            "DELETE FROM outbox WHERE status = 'delivered' AND delivered < ?",
+            (time.time() - self.keep_delivered,)
+        )
+
+    async def run(self, send, batch_size=5, poll_interval=1.0):
+        """
+        送信待ちのメッセージを古い順に batch_size 件ずつ send() で送り続ける
+
+        Args:
+            send: (ペイロードのリスト, batch_key()) を受け取り、成功したら True を返す async 関数
+                再送しても通らない時は DeliveryRejected を送出する
+            batch_size (int): 1回の send() に渡す件数の上限
+            poll_interval (float): 新しいメッセージが無い時に再送の時刻を確認する間隔（秒）
+        """
+        await asyncio.to_thread(self._execute, self._prune)
+        while True:
+            # 確認してから待つまでの間に登録された分を取りこぼさないように、確認の前に clear する
+            self._wakeup.clear()
+            rows = await asyncio.to_thread(self._execute, lambda conn: self._claim(conn, batch_size))
+            if not rows:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._deliver(rows, send)
+
+    async def _deliver(self, rows, send):
+        ids = [row_id for row_id, _, _ in rows]
+        permanent = False
+        try:
+            ok = await send([payload for _, _, payload in rows], self.batch_key(rows))
+            error = None if ok else "send failed"
+        except DeliveryRejected as e:
+            if len(rows) > 1:
+                # どの行が悪いのか分からないので、1件ずつ送り直す
+                for row in rows:
+                    await self._deliver([row], send)
+                return
+            ok, error, permanent = False, str(e), True
+        except Exception as e:
+            ok, error = False, str(e)
+        if ok:
+            await asyncio.to_thread(self._execute, lambda conn: self._mark_delivered(conn, ids))
+        else:
+            print("Error in outbox delivery:", error)
+            await asyncio.to_thread(self._execute, lambda conn: self._mark_failed(conn, ids, error, permanent))
+
+    def stats(self):
+        """
+        送信待ちの件数と遅延（秒）
+        """
+        def query(conn):
+            now = time.time()
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(created) FROM outbox WHERE status = 'pending'").fetchone()[0]
+            recent = conn.execute(
+                "SELECT AVG(delivered - created) FROM "
+                "(SELECT delivered, created FROM outbox WHERE status = 'delivered' ORDER BY delivered DESC LIMIT 100)"
+            ).fetchone()[0]
+            return {
+                "depth": counts.get("pending", 0),
+                "settling": counts.get("settling", 0),
+                "delivered": counts.get("delivered", 0),
+                "dead": counts.get("dead", 0),
+                "oldest_pending_age": now - oldest if oldest is not None else 0.0,
+                "recent_delivery_lag": recent or 0.0,
+                "commits": self.commits,
+            }
+        return self._execute(query)
+
+    def close(self):
+        self._execute(lambda conn: conn.close())
@@ -0,0 +1,69 @@
+"""
+プロンプトテンプレートの読み込みとキャッシュ
+"""
+
+import os
+import time
+
+
+class PromptRegistry:
+    """
+    プロンプトファイルを一度だけ読み込んでメモリに保持するレジストリ
+
+    ファイルの更新時刻(mtime)は check_interval 秒に一度だけ確認し、
+    変わっていれば読み直すので、ボットを再起動せずにプロンプトを編集できます。
+    読み直しに失敗した時（編集中でファイルが消えている・空になっている等）は前回の内容を使い続けます。
+    """
+    def __init__(self, paths=None, check_interval=2.0):
+        """
+        Args:
+            paths (dict): プロンプト名 -> ファイルパス
+            check_interval (float): mtime を確認する間隔（秒）
+        """
+        self.check_interval = check_interval
+        self._entries = {}  # name -> {"path", "mtime", "text"}
+        self._last_check = time.monotonic()
+        for name, path in (paths or {}).items():
+            self.register(name, path)
+
+    def register(self, name, path):
+        """
+        プロンプトファイルを登録して読み込む
+        """
+        self._entries[name] = {"path": path, "mtime": None, "text": None}
+        self._load(name)
+
+    def _load(self, name):
+        entry = self._entries[name]
+        mtime = os.stat(entry["path"]).st_mtime_ns
+        with open(entry["path"], "r", encoding="utf-8") as file:
+            text = file.read()
+        if not text.strip() and entry["text"] is not None:
+            raise ValueError(f"empty prompt file: {entry['path']}")
+        entry.update(mtime=mtime, text=text)
+        print(f"Loaded prompt: {name} ({entry['path']})")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        for name, entry in self._entries.items():
+            try:
+                mtime = os.stat(entry["path"]).st_mtime_ns
+            except OSError:
+                # 編集中で一時的にファイルが無い場合は前回の内容を使い続ける
+                continue
+            if mtime != entry["mtime"]:
+                try:
+                    self._load(name)
+                except (OSError, ValueError) as e:
+                    # 編集の途中で消えたり書きかけだったりした時は前回の内容を使い続ける（次の確認で読み直す）
+                    print("Error in prompt reload:", e)
+
+    def get(self, name):
+        """
+        プロンプトの本文を返す
+        """
+        self._maybe_reload()
+        return self._entries[name]["text"]
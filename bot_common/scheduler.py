@@ -0,0 +1,135 @@
+"""
+定期メッセージ（こちらから話しかけるメッセージ）のスケジューラ
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+
+class TokenBucket:
+    """
+    トークンバケット方式のレート制限
+    """
+    def __init__(self, rate, capacity):
+        """
+        Args:
+            rate (float): 1秒あたりに補充するトークン数
+            capacity (float): バケットの容量（瞬間的に許すバースト数）
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1):
+        """
+        トークンが溜まるまで待ってから消費する（先に待っている呼び出しが優先）
+        """
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+class ProactiveScheduler:
+    """
+    セッションごとにランダムな間隔で定期メッセージを送るスケジューラ
+
+    次の送信時刻はセッションごとに毎回 min_interval〜max_interval の乱数で決め直します。
+    job_queue から一定間隔で job() を呼び、送信時刻を過ぎたセッションをまとめて並列に処理します。
+    """
+    def __init__(self, send, chat_ids, min_interval, max_interval, is_active_hour=None,
+                 interval_factor=None, max_concurrency=8, timezone="Asia/Tokyo"):
+        """
+        Args:
+            send: (bot, chat_id) を受け取り定期メッセージを送る async 関数
+            chat_ids: 送信先の chat_id 一覧を返す関数
+            min_interval (float): 送信間隔の最小値（秒）
+            max_interval (float): 送信間隔の最大値（秒）
+            is_active_hour: 現在時刻(datetime)を受け取り、送ってよい時間帯なら True を返す関数
+            interval_factor: chat_id を受け取り送信間隔に掛ける倍率を返す関数（気分が下がっている時に短くするなど）
+            max_concurrency (int): 同じタイミングで並列に送る数の上限
+            timezone (str): is_active_hour に渡す時刻のタイムゾーン
+        """
+        self.send = send
+        self.chat_ids = chat_ids
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.is_active_hour = is_active_hour
+        self.interval_factor = interval_factor
+        self.timezone = ZoneInfo(timezone)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._next_fire = {}  # chat_id -> 次の送信時刻 (time.time())
+        self._running = False
+
+    def next_interval(self, chat_id):
+        """
+        次の送信までの間隔（秒）
+        """
+        interval = random.uniform(self.min_interval, self.max_interval)
+        if self.interval_factor is not None:
+            interval *= self.interval_factor(chat_id)
+        return interval
+
+    def _reschedule(self, chat_id, now):
+        self._next_fire[chat_id] = now + self.next_interval(chat_id)
+
+    def due_chat_ids(self, now):
+        """
+        送信時刻を過ぎた chat_id の一覧（初めて見たセッションは送信時刻を決めるだけ）
+        """
+        due = []
+        for chat_id in self.chat_ids():
+            fire_at = self._next_fire.get(chat_id)
+            if fire_at is None:
+                self._reschedule(chat_id, now)
+            elif fire_at <= now:
+                due.append(chat_id)
+        return due
+
+    async def job(self, context):
+        """
+        job_queue.run_repeating に渡すコールバック
+        """
+        await self.tick(context.bot)
+
+    async def tick(self, bot):
+        # 前回の送信がまだ終わっていなければ今回は見送る
+        if self._running:
+            return
+        self._running = True
+        try:
+            now = time.time()
+            due = self.due_chat_ids(now)
+            for chat_id in due:
+                self._reschedule(chat_id, now)
+            if not due:
+                return
+
+            # 静かにしている時間帯は送らずに次の時刻だけ決め直す
+            if self.is_active_hour is not None and not self.is_active_hour(datetime.now(self.timezone)):
+                return
+
+            # 同じタイミングのセッションはまとめて並列に生成・送信する
+            # （内容が同じプロンプトは GeminiClient 側で1リクエストにまとまる）
+            await asyncio.gather(*(self._fire(bot, chat_id) for chat_id in due))
+        finally:
+            self._running = False
+
+    async def _fire(self, bot, chat_id):
+        async with self._semaphore:
+            try:
+                await self.send(bot, chat_id)
+            except Exception as e:
+                print(f"Error in scheduled message to {chat_id}:", e)
@@ -0,0 +1,177 @@
+"""
+Telegram の chat_id ごとのセッション管理
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from bot_common.emotion import EmotionSeries
+from bot_common.metrics import span
+
+
+class Session:
+    """
+    1つのチャットの状態（履歴・要約・フラグ・感情スコア）
+    """
+    def __init__(self, chat_id, history=None, summarizer=None, chat_history_flag=True,
+                 emotion_scores=(), last_active=None):
+        self.chat_id = str(chat_id)
+        self.history = history
+        self.summarizer = summarizer
+        self.chat_history_flag = chat_history_flag
+        self.emotion = EmotionSeries(scores=emotion_scores)
+        self.last_active = last_active if last_active is not None else time.time()
+        # 同じチャットのメッセージを1件ずつ処理するためのロック
+        self.lock = asyncio.Lock()
+        # SessionManager.using() で使用中の数（0 より大きい間はメモリから外さない）
+        self.users = 0
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def is_busy(self):
+        """
+        返信の処理中か、バックグラウンドの要約が実行中か
+        """
+        if self.users > 0 or self.lock.locked():
+            return True
+        return self.summarizer is not None and self.summarizer.is_running()
+
+    def to_dict(self):
+        return {
+            "chat_id": self.chat_id,
+            "chat_history_flag": self.chat_history_flag,
+            "emotion_scores": self.emotion.to_list(),
+            "pending_turns": list(self.summarizer.pending) if self.summarizer is not None else [],
+            "last_active": self.last_active,
+        }
+
+
+class SessionManager:
+    """
+    chat_id ごとのセッションをLRUで管理する
+
+    メモリに置くのは最近使った max_active 件までで、それより古いセッションは
+    ディスク (sessions/<chat_id>.json) に書き出して履歴ごとメモリから外します。
+    """
+    def __init__(self, directory="sessions", max_active=100, store=None, summarizer_factory=None):
+        """
+        Args:
+            directory (str): セッションの保存先ディレクトリ
+            max_active (int): メモリに保持するセッション数の上限
+            store (ConversationStore): 会話履歴のストア（無ければ履歴を持たない）
+            summarizer_factory: (chat_id, 要約の保存先パス) を受け取り RollingSummarizer を返す関数
+        """
+        self.directory = directory
+        self.max_active = max_active
+        self.store = store
+        self.summarizer_factory = summarizer_factory
+        self._sessions = OrderedDict()  # chat_id -> Session（古い順）
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chat_id):
+        return os.path.join(self.directory, f"{chat_id}.json")
+
+    def get(self, chat_id):
+        """
+        セッションを返す（メモリに無ければディスクから読み込むか新しく作る）
+        """
+        chat_id = str(chat_id)
+        session = self._sessions.get(chat_id)
+        if session is not None:
+            self._sessions.move_to_end(chat_id)
+            session.touch()
+            return session
+
+        session = self._load(chat_id)
+        self._sessions[chat_id] = session
+        self._evict(keep=session)
+        return session
+
+    @contextlib.contextmanager
+    def using(self, chat_id):
+        """
+        セッションを返し、with を抜けるまでメモリから外さないようにする
+
+        返信の生成など await をまたいでセッションを使う間は get() ではなくこちらを使います。
+        """
+        session = self.get(chat_id)
+        session.users += 1
+        try:
+            yield session
+        finally:
+            session.users -= 1
+            self._evict()
+
+    def _load(self, chat_id):
+        state = {}
+        is_new = not os.path.exists(self._path(chat_id))
+        if not is_new:
+            with open(self._path(chat_id), "r", encoding="utf-8") as file:
+                state = json.load(file)
+
+        summarizer = None
+        if self.summarizer_factory is not None:
+            summary_path = os.path.join(self.directory, f"{chat_id}.summary.txt")
+            summarizer = self.summarizer_factory(chat_id, summary_path)
+            summarizer.pending = state.get("pending_turns", [])
+
+        session = Session(
+            chat_id,
+            history=self.store.history(chat_id) if self.store is not None else None,
+            summarizer=summarizer,
+            chat_history_flag=state.get("chat_history_flag", True),
+            emotion_scores=state.get("emotion_scores", ()),
+        )
+        if is_new:
+            # 定期メッセージの送信先として覚えておくため作成時にも保存する
+            self._save(session)
+        return session
+
+    def _save(self, session):
+        tmp_path = self._path(session.chat_id) + ".tmp"
+        with span("session.save"):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(session.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(session.chat_id))
+
+    def _evict(self, keep=None):
+        while len(self._sessions) > self.max_active:
+            # 返信・要約の処理中のセッションは終わるまで残す（keep は今から返すセッション）
+            victim = next((s for s in self._sessions.values() if s is not keep and not s.is_busy()), None)
+            if victim is None:
+                return
+            del self._sessions[victim.chat_id]
+            self._save(victim)
+            if self.store is not None:
+                self.store.unload(victim.chat_id)
+
+    def peek(self, chat_id):
+        """
+        メモリ上にあるセッションを返す（読み込みも最終利用時刻の更新もしない）
+        """
+        return self._sessions.get(str(chat_id))
+
+    def chat_ids(self):
+        """
+        これまでに会話したすべての chat_id（ディスクに退避したものも含む）
+        """
+        chat_ids = set(self._sessions)
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                chat_ids.add(filename[:-len(".json")])
+        return sorted(chat_ids)
+
+    def active_sessions(self):
+        return list(self._sessions.values())
+
+    def save_all(self):
+        """
+        メモリ上のすべてのセッションを保存する（終了時用）
+        """
+        for session in self._sessions.values():
+            self._save(session)
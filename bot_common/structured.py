@@ -0,0 +1,116 @@
+"""
+返答テキストに埋め込まれた JSON の取り出しと検証
+
+Gemini の返答はマークダウンのコードブロック (```json ... ```) に JSON を入れてきたり、
+前後に地の文が付いていたりするので、json.JSONDecoder.raw_decode で「{ か [ の位置から1つ分」だけを読みます。
+"""
+
+import json
+import re
+
+FENCE_PATTERN = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)```", re.DOTALL)
+JSON_START = re.compile(r"[{\[]")
+
+# 1つのテキストの中で JSON の読み取りを試す位置の上限（壊れたテキストで時間をかけない）
+MAX_DECODE_ATTEMPTS = 20
+
+# LINE の上限
+MAX_TEXT_LENGTH = 5000
+MAX_ALT_TEXT_LENGTH = 400
+MAX_COMMANDS = 5
+
+_decoder = json.JSONDecoder()
+
+
+class PayloadError(ValueError):
+    """
+    JSON は見つかったが形式が正しくない
+    """
+
+
+def extract_json(text):
+    """
+    テキストから最初の JSON（オブジェクトか配列）を取り出す（無ければ None）
+
+    コードブロックの中を優先し、無ければテキスト全体から探します。
+    """
+    blocks = FENCE_PATTERN.findall(text) + [text]
+    attempts = 0
+    for block in blocks:
+        for match in JSON_START.finditer(block):
+            if attempts >= MAX_DECODE_ATTEMPTS:
+                return None
+            attempts += 1
+            try:
+                value, _ = _decoder.raw_decode(block, match.start())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, (dict, list)):
+                return value
+    return None
+
+
+def _require_str(obj, field, max_length):
+    value = obj.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise PayloadError(f"'{field}' must be a non-empty string")
+    if len(value) > max_length:
+        raise PayloadError(f"'{field}' is longer than {max_length} characters")
+    return value
+
+
+def _validate_text(obj):
+    return {"type": "text", "text": _require_str(obj, "text", MAX_TEXT_LENGTH)}
+
+
+def _validate_flex(obj):
+    contents = obj.get("contents")
+    if not isinstance(contents, dict) or contents.get("type") not in ("bubble", "carousel"):
+        raise PayloadError("'contents' must be a flex bubble or carousel")
+    return {"type": "flex", "altText": _require_str(obj, "altText", MAX_ALT_TEXT_LENGTH), "contents": contents}
+
+
+def _validate_action(obj):
+    params = obj.get("params", {})
+    if not isinstance(params, dict):
+        raise PayloadError("'params' must be an object")
+    return {"type": "action", "action": _require_str(obj, "action", 100), "params": params}
+
+
+VALIDATORS = {
+    "text": _validate_text,
+    "flex": _validate_flex,
+    "action": _validate_action,
+}
+
+
+def validate_commands(value):
+    """
+    取り出した JSON を検証して、type ごとに正規化したコマンドのリストにする
+
+    受け付ける形:
+        {"type": "text", "text": "..."}
+        {"type": "flex", "altText": "...", "contents": {"type": "bubble", ...}}
+        {"type": "action", "action": "名前", "params": {...}}
+        上のリスト、または {"messages": [...]}
+
+    Raises:
+        PayloadError: 形式が正しくない場合
+    """
+    if isinstance(value, dict) and "messages" in value and "type" not in value:
+        value = value["messages"]
+    items = value if isinstance(value, list) else [value]
+    if not items:
+        raise PayloadError("no commands")
+    if len(items) > MAX_COMMANDS:
+        raise PayloadError(f"more than {MAX_COMMANDS} commands")
+
+    commands = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise PayloadError("each command must be an object")
+        validator = VALIDATORS.get(item.get("type"))
+        if validator is None:
+            raise PayloadError(f"unknown type: {item.get('type')!r}")
+        commands.append(validator(item))
+    return commands
@@ -0,0 +1,123 @@
+"""
+会話履歴の増分要約
+"""
+
+import asyncio
+import os
+
+from bot_common.conversation import estimate_tokens
+from bot_common.metrics import span
+
+
+class RollingSummarizer:
+    """
+    新しいターンだけを既存の要約に畳み込むローリング要約
+
+    返信処理とは別タスクで実行し、一定のターン数か文字数が溜まった時だけ要約を更新します。
+    """
+    def __init__(self, generate, prompts, prompt_name="summarize", summary_path="summary.txt",
+                 min_turns=6, min_chars=600, max_pending=50):
+        """
+        Args:
+            generate: プロンプト文字列を受け取り要約テキストを返す async 関数
+            prompts (PromptRegistry): 要約指示のプロンプトを持つレジストリ
+            prompt_name (str): 要約指示のプロンプト名
+            summary_path (str): 要約の保存先
+            min_turns (int): 要約を更新するのに必要な未要約ターン数
+            min_chars (int): 要約を更新するのに必要な未要約文字数
+            max_pending (int): 要約の失敗が続いた時に残しておく未要約ターン数の上限（超えたら古いものから捨てる）
+        """
+        self.generate = generate
+        self.prompts = prompts
+        self.prompt_name = prompt_name
+        self.summary_path = summary_path
+        self.min_turns = min_turns
+        self.min_chars = min_chars
+        self.max_pending = max_pending
+        self.pending = []  # まだ要約に畳み込んでいないターン
+        self._folding = []  # 要約の更新中で、まだ要約に入っていないターン
+        self._task = None
+
+        self.summary = ""
+        if os.path.exists(summary_path):
+            with open(summary_path, "r", encoding="utf-8") as file:
+                self.summary = file.read()
+
+    def add_turn(self, speaker, text):
+        """
+        未要約のターンを追加
+        """
+        self.pending.append(f"[{speaker}の発言]:{text}")
+
+    def unfolded(self, token_budget=None):
+        """
+        まだ要約に入っていないターン（更新中の分も含む）をプロンプト用の文字列にする
+        要約の後ろに付ければ、要約と合わせて会話全体になります
+        token_budget を渡すと、要約が失敗し続けて溜まった時でも新しい方からその範囲に収めます
+        """
+        lines = []
+        used = 0
+        for turn in reversed(self._folding + self.pending):
+            line = f"{turn}\n"
+            cost = estimate_tokens(line)
+            if token_budget is not None and lines and used + cost > token_budget:
+                break
+            lines.append(line)
+            used += cost
+        return "".join(reversed(lines))
+
+    def should_fold(self):
+        """
+        要約を更新するだけの量が溜まっているか
+        """
+        pending_chars = sum(len(turn) for turn in self.pending)
+        return len(self.pending) >= self.min_turns or pending_chars >= self.min_chars
+
+    def is_running(self):
+        """
+        要約の更新が実行中か
+        """
+        return self._task is not None and not self._task.done()
+
+    def maybe_fold(self):
+        """
+        閾値を超えていればバックグラウンドで要約を更新する
+        実行中の要約がある場合は次回に回す
+        """
+        if self.is_running():
+            return None
+        if not self.pending or not self.should_fold():
+            return None
+
+        turns = self.pending
+        self.pending = []
+        self._folding = turns
+        self._task = asyncio.create_task(self._fold(turns))
+        return self._task
+
+    async def _fold(self, turns):
+        prompt = self.prompts.get(self.prompt_name)
+        contents = (
+            prompt
+            + "\n[これまでの要約]\n" + self.summary
+            + "\n[新しい会話]\n" + "\n".join(turns) + "\n"
+        )
+        try:
+            summary = await self.generate(contents)
+        except Exception as e:
+            # 失敗したターンは戻して次回の要約で再試行
+            print("Error in summarize:", e)
+            self.pending[:0] = turns
+            self._folding = []
+            # 失敗が続いても溜まり続けないように古いターンから捨てる（会話履歴のストアには残っている）
+            dropped = len(self.pending) - self.max_pending
+            if dropped > 0:
+                del self.pending[:dropped]
+                print(f"Dropped {dropped} unsummarized turns")
+            return
+
+        self.summary = summary
+        self._folding = []
+        print("\n", summary)
+        with span("summary.write"), open(self.summary_path, "w", encoding="utf-8") as f:
+            f.write(summary)
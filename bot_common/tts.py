@@ -0,0 +1,308 @@
+"""
+音声合成と再生の共通モジュール
+"""
+
+import asyncio
+import contextvars
+import io
+import os
+import re
+import sys
+import time
+
+import aiohttp
+
+from bot_common.audio_cache import cache_key
+from bot_common.metrics import span
+
+# 文の区切り（日本語・英語の句読点と改行）
+SENTENCE_PATTERN = re.compile(r"[^。！？!?\n]+[。！？!?]*|[。！？!?]+")
+WORD_PATTERN = re.compile(r"\w")
+
+
+def split_sentences(text):
+    """
+    テキストを読み上げ単位の文に分割する
+    """
+    sentences = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = match.group().strip()
+        if not sentence:
+            continue
+        if sentences and WORD_PATTERN.search(sentence) is None:
+            # 記号や絵文字だけの断片は前の文にくっつける
+            sentences[-1] += sentence
+        else:
+            sentences.append(sentence)
+    return sentences
+
+
+class AudioSink:
+    """
+    音声の再生先（play はワーカースレッドから呼ばれ、再生が終わるまでブロックする）
+    """
+    def play(self, audio, fmt):
+        raise NotImplementedError
+
+
+class NullSink(AudioSink):
+    """
+    何も再生しない（ヘッドレス環境用）
+    """
+    def play(self, audio, fmt):
+        pass
+
+
+class PygameSink(AudioSink):
+    """
+    pygame.mixer でメモリ上の音声を再生する
+    mixer はプロセスで一度だけ初期化する
+    """
+    def __init__(self):
+        import pygame
+        self._pygame = pygame
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+
+    def play(self, audio, fmt):
+        mixer = self._pygame.mixer
+        if fmt == "wav":
+            channel = mixer.Sound(file=io.BytesIO(audio)).play()
+            while channel is not None and channel.get_busy():
+                time.sleep(0.05)
+        else:
+            # MP3 は music でファイルを介さずに再生する
+            mixer.music.load(io.BytesIO(audio), fmt)
+            mixer.music.play()
+            while mixer.music.get_busy():
+                time.sleep(0.05)
+            mixer.music.unload()
+
+
+class WinsoundSink(AudioSink):
+    """
+    winsound でメモリ上のWAVを再生する（Windowsのみ）
+    WAV以外は pygame に任せる
+    """
+    def __init__(self):
+        import winsound
+        self._winsound = winsound
+        self._fallback = None
+
+    def play(self, audio, fmt):
+        if fmt == "wav":
+            self._winsound.PlaySound(audio, self._winsound.SND_MEMORY)
+            return
+        if self._fallback is None:
+            self._fallback = PygameSink()
+        self._fallback.play(audio, fmt)
+
+
+def default_sink():
+    """
+    環境に合わせた再生先を選ぶ
+    環境変数 BOT_AUDIO_SINK (winsound / pygame / null) で指定も可能
+    """
+    name = os.getenv("BOT_AUDIO_SINK")
+    if name is None:
+        name = "winsound" if sys.platform == "win32" else "pygame"
+
+    try:
+        if name == "winsound":
+            return WinsoundSink()
+        if name == "pygame":
+            return PygameSink()
+    except Exception as e:
+        print(f"Audio sink '{name}' is not available ({e}), audio is disabled")
+    return NullSink()
+
+
+class VoicevoxClient:
+    """
+    VOICEVOX エンジンの非同期クライアント
+
+    HTTPセッションを使い回して localhost への接続をプールします。
+    cache (AudioCache) を渡すと、同じテキスト・パラメータの音声はエンジンを呼ばずにキャッシュから返します。
+    """
+    def __init__(self, host="localhost", port=50021, max_connections=4, cache=None):
+        self.base_url = f"http://{host}:{port}"
+        self.max_connections = max_connections
+        self.cache = cache
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def synthesize(self, text, speaker=4, speedScale=0.8, pitchScale=1.0, intonationScale=0.5):
+        """
+        VoicevoxのAPIを使って音声合成し、WAVのバイト列を返します。失敗した場合は None を返します。
+
+        Args:
+            text (str): 読み上げたいテキスト
+            speaker (int): 声のキャラクターID
+            speedScale (float): 話す速度（0.5〜2.0など）
+            pitchScale (float): 声の高さ（-1.0〜1.0など）
+            intonationScale (float): 抑揚（0.0〜2.0）
+        """
+        if self.cache is None:
+            return await self._synthesize(text, speaker, speedScale, pitchScale, intonationScale)
+        key = cache_key(text, speaker, speedScale, pitchScale, intonationScale, engine="voicevox")
+        return await self.cache.get_or_create(
+            key, lambda: self._synthesize(text, speaker, speedScale, pitchScale, intonationScale)
+        )
+
+    async def _synthesize(self, text, speaker, speedScale, pitchScale, intonationScale):
+        session = self._get_session()
+
+        # 1. 音声合成用クエリを作成
+        query_params = {"text": text, "speaker": speaker}
+        with span("voicevox.audio_query"):
+            async with session.post(f"{self.base_url}/audio_query", params=query_params) as res_query:
+                if res_query.status != 200:
+                    print("Error in audio_query:", await res_query.text())
+                    return None
+                query_json = await res_query.json()
+
+        # クエリのパラメータを変更（速度・高さ・抑揚など）
+        query_json["speedScale"] = speedScale
+        query_json["pitchScale"] = pitchScale
+        query_json["intonationScale"] = intonationScale
+        query_json["prePhonemeLength"] = 0.1  # 発声前の無音秒数調整（任意）
+        query_json["postPhonemeLength"] = 0.1  # 発声後の無音秒数調整（任意）
+
+        # 2. 合成音声生成リクエスト
+        with span("voicevox.synthesis"):
+            async with session.post(f"{self.base_url}/synthesis", params={"speaker": speaker}, json=query_json) as res_synthesis:
+                if res_synthesis.status != 200:
+                    print("Error in synthesis:", await res_synthesis.text())
+                    return None
+                return await res_synthesis.read()
+
+    async def speakers(self):
+        """
+        利用できる話者の一覧を返す
+        """
+        async with self._get_session().get(f"{self.base_url}/speakers") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+async def gtts_synthesize(text, lang="en", tld="com", slow=False, cache=None):
+    """
+    gTTS で音声合成し、MP3のバイト列を返します。
+
+    Args:
+        text (str): 読み上げたいテキスト
+        lang (str): 言語（'en', 'ja'など）
+        tld (str): アクセント（'com'=米国, 'co.uk'=英国, 'com.au'=豪州など）
+        slow (bool): True=ゆっくり、False=通常速度
+        cache (AudioCache): 合成済み音声のキャッシュ
+    """
+    def synthesize():
+        from gtts import gTTS
+        buffer = io.BytesIO()
+        with span("gtts"):
+            gTTS(text=text, lang=lang, slow=slow, tld=tld).write_to_fp(buffer)
+        return buffer.getvalue()
+
+    if cache is None:
+        return await asyncio.to_thread(synthesize)
+    key = cache_key(text, engine=f"gtts:{lang}:{tld}:{slow}")
+    return await cache.get_or_create(key, lambda: asyncio.to_thread(synthesize))
+
+
+class PlaybackQueue:
+    """
+    音声を1つずつ順番に再生するバックグラウンドキュー
+
+    合成中のタスクもそのまま積めるので、呼び出し側は再生を待たずに戻れます。
+    """
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else default_sink()
+        self._queue = asyncio.Queue()
+        self._worker = None
+
+    def put(self, source, fmt="wav"):
+        """
+        再生を予約する
+
+        Args:
+            source: 音声のバイト列、またはバイト列を返す Future / Task
+            fmt (str): 音声フォーマット（"wav" / "mp3"）
+        """
+        if self._worker is None or self._worker.done():
+            # 再生はどのメッセージにも属さないので、呼び出し元の計測コンテキストを引き継がない
+            # （create_task の context= は 3.11 からなので、空のコンテキストの中でタスクを作る）
+            self._worker = contextvars.Context().run(asyncio.create_task, self._run())
+        self._queue.put_nowait((source, fmt))
+
+    async def _run(self):
+        while True:
+            source, fmt = await self._queue.get()
+            try:
+                audio = await source if asyncio.isfuture(source) else source
+                if audio:
+                    with span("playback"):
+                        await asyncio.to_thread(self.sink.play, audio, fmt)
+            except Exception as e:
+                print("Error in playback:", e)
+            finally:
+                self._queue.task_done()
+
+    async def join(self):
+        """
+        予約済みの音声をすべて再生し終えるまで待つ
+        """
+        await self._queue.join()
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+
+class VoicevoxSpeaker:
+    """
+    VOICEVOX で合成して再生キューに積む読み上げ役
+    """
+    def __init__(self, client=None, playback=None, max_parallel=2):
+        """
+        Args:
+            client (VoicevoxClient): 合成に使うクライアント
+            playback (PlaybackQueue): 再生キュー
+            max_parallel (int): 文ごとのストリーミング合成で同時に合成する数
+        """
+        self.client = client if client is not None else VoicevoxClient()
+        self.playback = playback if playback is not None else PlaybackQueue()
+        self._semaphore = asyncio.Semaphore(max_parallel)
+
+    def stream_and_play(self, text, speaker=4, speedScale=0.8, pitchScale=1.0, intonationScale=0.5):
+        """
+        文ごとに分けて並列に合成し、合成できた文から順番に再生する（引数は VoicevoxClient.synthesize と同じ）
+        最初の音声が出るまでの時間が1文分の合成時間で済む
+        """
+        tasks = []
+        for sentence in split_sentences(text):
+            task = asyncio.ensure_future(
+                self._synthesize_bounded(sentence, speaker, speedScale, pitchScale, intonationScale)
+            )
+            self.playback.put(task, "wav")
+            tasks.append(task)
+        return tasks
+
+    async def _synthesize_bounded(self, *args):
+        # 先に予約した文から順にセマフォを取るので、最初の文が最優先で合成される
+        async with self._semaphore:
+            return await self.client.synthesize(*args)
+
+    async def close(self):
+        await self.playback.close()
+        await self.client.close()
@@ -0,0 +1,175 @@
+"""
+Telegram の Webhook を受ける aiohttp サーバー
+
+run_polling の代わりに Telegram から HTTP で更新を受け取り、固定数のワーカーで並列に処理します。
+同じ aiohttp のアプリに他のルート（LINE の中継など）を追加して、1つのサーバーでまとめて受けられます。
+"""
+
+import asyncio
+import zlib
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WorkerPool:
+    """
+    キーごとの順番を保ったまま並列に処理する固定数のワーカー
+
+    同じキー（chat_id）の更新は必ず同じワーカーのキューに積むので、1つのチャットの中では順番が入れ替わらず、
+    別々のチャットは並列に処理されます。キューが一杯の時は submit() が False を返します。
+    """
+    def __init__(self, handler, workers=8, max_queue=100):
+        """
+        Args:
+            handler: 1件分のデータを受け取って処理する async 関数
+            workers (int): ワーカー数（同時に処理するチャット数の上限）
+            max_queue (int): ワーカーごとのキューの上限
+        """
+        self.handler = handler
+        self._queues = [asyncio.Queue(max_queue) for _ in range(workers)]
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run(queue)) for queue in self._queues]
+
+    def submit(self, key, item):
+        """
+        処理を予約する（キューが一杯なら False）
+        """
+        queue = self._queues[zlib.crc32(str(key).encode("utf-8")) % len(self._queues)]
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def depth(self):
+        """
+        処理待ちの件数
+        """
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _run(self, queue):
+        while True:
+            item = await queue.get()
+            try:
+                await self.handler(item)
+            except Exception as e:
+                print("Error in webhook worker:", e)
+            finally:
+                queue.task_done()
+
+    async def join(self):
+        """
+        予約済みの処理がすべて終わるまで待つ
+        """
+        for queue in self._queues:
+            await queue.join()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+
+def telegram_chat_key(data):
+    """
+    Update の JSON から並び順を保つためのキー（chat_id）を取り出す
+    """
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = data.get(field)
+        if message:
+            return message.get("chat", {}).get("id")
+    callback = data.get("callback_query")
+    if callback:
+        return callback.get("from", {}).get("id")
+    return data.get("update_id")
+
+
+def create_webhook_server(application, path="/telegram", secret_token=None, workers=8, max_queue=100):
+    """
+    Telegram の Webhook を受ける aiohttp のアプリを作る
+
+    Args:
+        application: python-telegram-bot の Application
+        path (str): Webhook を受けるパス
+        secret_token (str): set_webhook に渡したシークレット（ヘッダーと一致しない要求は拒否する）
+        workers (int): 並列に処理するワーカー数
+        max_queue (int): ワーカーごとのキューの上限（超えたら 503 を返して Telegram に再送させる）
+
+    Returns:
+        web.Application: app["telegram_pool"] にワーカープールが入っている
+    """
+    from telegram import Update
+
+    async def process(data):
+        await application.process_update(Update.de_json(data, application.bot))
+
+    pool = WorkerPool(process, workers, max_queue)
+
+    async def telegram_webhook(request):
+        if secret_token and request.headers.get(SECRET_HEADER) != secret_token:
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        # 処理は待たずにすぐ 200 を返す（待つと Telegram 側がタイムアウトして再送してくる）
+        if not pool.submit(telegram_chat_key(data), data):
+            return web.Response(status=503)
+        return web.Response(status=200)
+
+    async def healthz(request):
+        return web.json_response({"status": "ok", "pending_updates": pool.depth()})
+
+    async def start_pool(app):
+        pool.start()
+
+    async def stop_pool(app):
+        await pool.close()
+
+    app = web.Application()
+    app["telegram_pool"] = pool
+    app.router.add_post(path, telegram_webhook)
+    app.router.add_get("/healthz", healthz)
+    app.on_startup.append(start_pool)
+    app.on_cleanup.append(stop_pool)
+    return app
+
+
+def webhook_path(webhook_url, default="/telegram"):
+    """
+    公開URL（https://example.com/telegram など）からサーバーで受けるパスを取り出す
+    """
+    return urlsplit(webhook_url).path or default
+
+
+async def serve_webhook(application, server, webhook_url, host="0.0.0.0", port=8443, secret_token=None):
+    """
+    Webhook を登録してサーバーを起動し、止められるまで待つ
+
+    Args:
+        application: python-telegram-bot の Application（initialize 済み）
+        server (web.Application): create_webhook_server() で作ったアプリ
+        webhook_url (str): Telegram に登録する公開URL（リバースプロキシ経由でこのサーバーに届くもの）
+        host (str): 待ち受けるアドレス
+        port (int): 待ち受けるポート
+        secret_token (str): Telegram が要求に付けるシークレット
+    """
+    runner = web.AppRunner(server)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await application.start()
+    # 停止中に届いた更新は Telegram 側に残っているので捨てずに処理する
+    await application.bot.set_webhook(url=webhook_url, secret_token=secret_token, drop_pending_updates=False)
+    print(f"Webhook: {webhook_url} -> http://{host}:{port}{webhook_path(webhook_url)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await application.stop()
+        await application.shutdown()